@@ -1,6 +1,6 @@
 import os
 from langchain_openai import ChatOpenAI
-from parser import Llama_document_parser
+from parser import PDF_FILES, Llama_document_parser
 from db_creator import df_to_dbtbl
 import lancedb
 from langchain_google_genai import ChatGoogleGenerativeAI
@@ -16,10 +16,11 @@ from IPython.display import Image, display
 
 memory = MemorySaver()
 
-doc_dfs = Llama_document_parser()
+doc_chunks = Llama_document_parser(stream=True)
 
 db = lancedb.connect(".lancedb")
-tbl = df_to_dbtbl(db, doc_dfs)
+# Chunks of the book that changed or disappeared are removed, so retrieval never sees an outdated copy
+tbl = df_to_dbtbl(db, doc_chunks, prune=True, file_names=[os.path.basename(path) for path in PDF_FILES])
 import logging
 
 with open(r'..\Codes\log.txt', 'w') as file:
@@ -57,7 +58,7 @@ graph = combined_graph_builder(gemini_chat, tbl, logger)
 async def on_chat_start():
     model = graph
     cl.user_session.set("runnable", model)
-    cl.Message(content="Hello! I am a chatbot. How can I help you?").send()
+    await cl.Message(content="Hello! I am a chatbot. How can I help you?").send()
 
 @cl.on_message
 async def on_message(message: cl.Message):
@@ -67,7 +68,8 @@ async def on_message(message: cl.Message):
     # graph.get_state(config)
     final_answer = cl.Message(content="")
     this_time_messages = []
-    for msg, metadata in graph.stream({"messages": HumanMessage(content=message.content)}, stream_mode="messages", config=RunnableConfig(callbacks=[cb], **config)):
+    # Nodes are async and offload database work, so one slow turn does not stall other sessions
+    async for msg, metadata in graph.astream({"messages": HumanMessage(content=message.content)}, stream_mode="messages", config=RunnableConfig(callbacks=[cb], **config)):
         this_time_messages.append(msg)
         if not isinstance(msg, AIMessage):
             continue
@@ -0,0 +1,171 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import time
+from datetime import datetime, timezone
+
+import lancedb
+
+from db_creator import df_to_dbtbl, ensure_indexes
+from embeddings import embed_query, get_backend
+from parser import PDF_FILES, parse_file
+from retrieval import NPROBES, REFINE_FACTOR, run_search
+
+
+QUERIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_queries.json")
+QUERY_TYPES = ("vector", "fts", "hybrid")
+
+logger = logging.getLogger(__name__)
+
+
+def load_queries(path: str = QUERIES_FILE):
+    """
+    :return: List of {"query": ..., "relevant_terms": [...]} dicts
+    """
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)["queries"]
+
+
+def relevant_hashes(chunks, terms):
+    """
+    Content hashes of the chunks whose text contains every term (case-insensitive).
+    """
+    terms = [term.lower() for term in terms]
+    return {chunk["content_hash"] for chunk in chunks if all(term in chunk["text"].lower() for term in terms)}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def build_tables(db, pdf_files, ann: bool):
+    """
+    Embed the corpus once into a 'flat' table (FTS index, brute-force vectors) and,
+    when ann is set, copy it into an 'ivf_pq' table with a forced IVF-PQ index.
+    Text is extracted with pypdf so every run benchmarks the same chunks.
+    :return: {config name: table}
+    """
+    data = [parse_file(path, offline=True) for path in pdf_files]
+    flat = df_to_dbtbl(db, (record for frame in data for record in frame.to_dict(orient="records")),
+                       table_name="bench_flat", mode="overwrite", logger=logger)
+    tables = {"flat": flat}
+    if ann:
+        indexed = db.create_table("bench_ivf_pq", data=flat.to_arrow(), mode="overwrite")
+        ensure_indexes(indexed, rebuild=True, logger=logger, ann_min_rows=0)
+        tables["ivf_pq"] = indexed
+    return tables
+
+
+def run_config(tbl, queries, labels, exact_topk, query_type, k, repeats, nprobes, refine_factor):
+    """
+    Time uncached searches of one query type against one table and score them.
+    :param labels: Relevant content hashes per query
+    :param exact_topk: Brute-force vector top-k hashes per query, to measure ANN recall (optional)
+    :return: Dict of latency, throughput and quality metrics
+    """
+    latencies = []
+    recalls, hits, ann_recalls = [], [], []
+    started = time.perf_counter()
+    for repeat in range(repeats):
+        for i, item in enumerate(queries):
+            t0 = time.perf_counter()
+            results = run_search(tbl, item["query"], query_type, k, nprobes, refine_factor)
+            latencies.append(time.perf_counter() - t0)
+            if repeat:
+                continue
+
+            found = results.column("content_hash").to_pylist()[:k]
+            relevant = labels[i]
+            if relevant:
+                recalls.append(len(relevant.intersection(found)) / min(k, len(relevant)))
+                hits.append(1.0 if relevant.intersection(found) else 0.0)
+            if exact_topk is not None and exact_topk[i]:
+                ann_recalls.append(len(exact_topk[i].intersection(found)) / len(exact_topk[i]))
+    elapsed = time.perf_counter() - started
+
+    metrics = {
+        "queries": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "qps": round(len(latencies) / elapsed, 2),
+        f"recall@{k}": round(statistics.fmean(recalls), 4) if recalls else None,
+        f"hit@{k}": round(statistics.fmean(hits), 4) if hits else None,
+    }
+    if ann_recalls:
+        metrics[f"ann_recall@{k}"] = round(statistics.fmean(ann_recalls), 4)
+    return metrics
+
+
+def run_benchmark(db, pdf_files=None, queries_file: str = QUERIES_FILE, k: int = 10, repeats: int = 3,
+                  query_types=QUERY_TYPES, ann: bool = True, nprobes: int = NPROBES, refine_factor=REFINE_FACTOR):
+    """
+    Benchmark vector, full-text and hybrid search with and without the IVF-PQ index.
+    Query vectors are embedded once up front, so latencies cover search only.
+    :param repeats: Passes over the query set; quality is scored on the first pass
+    :return: Report dict (metadata plus one entry per table config and query type)
+    """
+    pdf_files = pdf_files or PDF_FILES
+    queries = load_queries(queries_file)
+    tables = build_tables(db, pdf_files, ann)
+
+    chunks = tables["flat"].to_lance().to_table(columns=["text", "content_hash"]).to_pylist()
+    labels = [relevant_hashes(chunks, item["relevant_terms"]) for item in queries]
+    for item in queries:
+        embed_query(item["query"])
+
+    # Brute-force vector results are the reference for ANN recall
+    exact_topk = [set(run_search(tables["flat"], item["query"], "vector", k).column("content_hash").to_pylist())
+                  for item in queries]
+
+    results = {}
+    for config, tbl in tables.items():
+        for query_type in query_types:
+            name = f"{config}/{query_type}"
+            # ANN recall only means something for vector results of an indexed table
+            reference = exact_topk if config != "flat" and query_type == "vector" else None
+            results[name] = run_config(tbl, queries, labels, reference, query_type, k, repeats, nprobes, refine_factor)
+            logger.info(f"{name}: {results[name]}")
+
+    return {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "lancedb_version": lancedb.__version__,
+            "embedding_backend": get_backend().backend,
+            "files": [os.path.basename(path) for path in pdf_files],
+            "chunks": len(chunks),
+            "queries": len(queries),
+            "labeled_queries": sum(1 for relevant in labels if relevant),
+            "k": k,
+            "repeats": repeats,
+            "nprobes": nprobes,
+            "refine_factor": refine_factor,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Benchmark LanceDB retrieval latency and quality.")
+    arg_parser.add_argument("--db", default=".lancedb_bench")
+    arg_parser.add_argument("--pdf", action="append", help="Corpus file (repeatable); defaults to PDF_FILES")
+    arg_parser.add_argument("--queries", default=QUERIES_FILE)
+    arg_parser.add_argument("-k", type=int, default=10)
+    arg_parser.add_argument("--repeats", type=int, default=3)
+    arg_parser.add_argument("--query-types", nargs="+", default=list(QUERY_TYPES), choices=QUERY_TYPES)
+    arg_parser.add_argument("--no-ann", action="store_true", help="Skip the IVF-PQ table")
+    arg_parser.add_argument("--nprobes", type=int, default=NPROBES)
+    arg_parser.add_argument("--refine-factor", type=int, default=REFINE_FACTOR)
+    arg_parser.add_argument("--output", default="bench_retrieval.json")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_benchmark(lancedb.connect(args.db), args.pdf, args.queries, args.k, args.repeats,
+                           args.query_types, not args.no_ann, args.nprobes, args.refine_factor)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report["results"], indent=2))
@@ -0,0 +1,89 @@
+import argparse
+import json
+import logging
+from datetime import datetime, timezone
+
+from embeddings import get_backend
+from router import (ROUTER_EVAL_FILE, ROUTER_TARGET_ACCURACY, calibrate_route_cache, calibrate_router, graph_router,
+                    load_router_eval, order_action_router, pair_similarities, routing_quality)
+
+
+ROUTERS = {"graph": graph_router, "order_action": order_action_router}
+
+logger = logging.getLogger(__name__)
+
+
+def evaluate_router(router, items, target_accuracy: float = ROUTER_TARGET_ACCURACY):
+    """
+    Calibrate a router on labeled messages and report how it does there.
+    :param items: List of {"message": ..., "route": ...} dicts
+    :return: Dict with the calibrated threshold and margin, their accuracy and coverage,
+             the accuracy of routing every message locally, and the misrouted messages
+    """
+    routes = [item["route"] for item in items]
+    decisions = router.score_messages([item["message"] for item in items])
+    threshold, margin = calibrate_router(decisions, routes, target_accuracy)
+    accuracy, coverage = routing_quality(decisions, routes, threshold, margin)
+    top1_accuracy, _ = routing_quality(decisions, routes, float("-inf"), float("-inf"))
+    return {
+        "messages": len(items),
+        "threshold": round(threshold, 4),
+        "margin": round(margin, 4),
+        "accuracy": round(accuracy, 4),
+        "coverage": round(coverage, 4),
+        "top1_accuracy": round(top1_accuracy, 4),
+        "misrouted": [
+            {"message": item["message"], "route": item["route"], "predicted": route,
+             "confidence": round(confidence, 4), "margin": round(lead, 4)}
+            for item, (route, confidence, lead) in zip(items, decisions) if route != item["route"]
+        ],
+    }
+
+
+def evaluate_route_cache(pairs):
+    """
+    Calibrate the route cache threshold on labeled message pairs.
+    :param pairs: List of {"cached": ..., "query": ..., "same_route": ...} dicts
+    :return: Dict with the threshold, the share of same-route pairs that hit and every pair's similarity
+    """
+    similarities = pair_similarities(pairs)
+    threshold, hit_rate = calibrate_route_cache(similarities, [pair["same_route"] for pair in pairs])
+    return {
+        "pairs": len(pairs),
+        "threshold": round(threshold, 4),
+        "same_route_hit_rate": round(hit_rate, 4),
+        "similarities": sorted(({**pair, "similarity": round(float(similarity), 4)}
+                                for pair, similarity in zip(pairs, similarities)),
+                               key=lambda pair: pair["similarity"], reverse=True),
+    }
+
+
+def run_benchmark(eval_file: str = ROUTER_EVAL_FILE, target_accuracy: float = ROUTER_TARGET_ACCURACY):
+    """
+    :return: Report dict (metadata plus one entry per router and one for the route cache)
+    """
+    data = load_router_eval(eval_file)
+    results = {name: evaluate_router(router, data[name], target_accuracy) for name, router in ROUTERS.items()}
+    results["route_cache"] = evaluate_route_cache(data["cache_pairs"])
+    return {
+        "metadata": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "embedding_backend": get_backend().backend,
+            "target_accuracy": target_accuracy,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Calibrate the routers and the route cache on labeled messages.")
+    arg_parser.add_argument("--eval", default=ROUTER_EVAL_FILE)
+    arg_parser.add_argument("--target-accuracy", type=float, default=ROUTER_TARGET_ACCURACY)
+    arg_parser.add_argument("--output", default="bench_router.json")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    report = run_benchmark(args.eval, args.target_accuracy)
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(json.dumps(report["results"], indent=2))
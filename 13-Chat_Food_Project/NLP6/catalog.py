@@ -0,0 +1,149 @@
+import sqlite3
+import threading
+from array import array
+
+from db_pool import get_pool
+from fuzzy_index import FuzzyNameIndex
+
+
+CATALOG_QUERY = "SELECT id, food_name, food_category, restaurant_name, price FROM foods"
+
+
+class CatalogSnapshot:
+    """
+    A read-only, column-oriented copy of the foods table.
+    Ids and prices live in typed arrays, names are lowercased once at build
+    time and both name columns carry a prebuilt fuzzy index.
+    """
+
+    def __init__(self, rows):
+        """
+        :param rows: (id, food_name, food_category, restaurant_name, price) tuples in table order
+        """
+        self.ids = array("q", (row[0] for row in rows))
+        self.food_names = tuple(row[1] for row in rows)
+        self.categories = tuple(row[2] for row in rows)
+        self.restaurant_names = tuple(row[3] for row in rows)
+        self.prices = array("d", (row[4] for row in rows))
+        self.positions_by_id = {food_id: position for position, food_id in enumerate(self.ids)}
+        self.category_set = frozenset(self.categories)
+
+        self.food_names_lower = tuple(name.lower() for name in self.food_names)
+        self.restaurant_names_lower = tuple(name.lower() for name in self.restaurant_names)
+
+        self.food_index = FuzzyNameIndex(self.food_names_lower)
+        self.restaurant_index = FuzzyNameIndex(self.restaurant_names_lower)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self):
+        """
+        :return: The snapshot as (id, food_name, food_category, restaurant_name, price) tuples
+        """
+        return list(zip(self.ids, self.food_names, self.categories, self.restaurant_names, self.prices))
+
+    def resolve_category(self, category):
+        """
+        Map a free-text category, e.g. an LLM's 'Italian', onto one stored in the table.
+        :param category: Category as written, e.g. 'fast food' or 'italian'
+        :return: The stored category, e.g. 'italian_food', or None if there is none like it
+        """
+        key = "_".join(category.strip().strip("'\"").lower().replace("-", " ").split())
+        for candidate in (key, f"{key}_food"):
+            if candidate in self.category_set:
+                return candidate
+        return None
+
+    def row(self, position):
+        """
+        :param position: Row position in the snapshot
+        :return: Dict with the row's columns
+        """
+        return {
+            'id': self.ids[position],
+            'food_name': self.food_names[position],
+            'food_category': self.categories[position],
+            'restaurant_name': self.restaurant_names[position],
+            'price': self.prices[position],
+        }
+
+
+class Catalog:
+    """
+    Keeps a CatalogSnapshot in sync with the database.
+
+    A dedicated read-only connection polls PRAGMA data_version, which changes
+    whenever any other connection (pooled or another process) commits. Only
+    then is the catalog_version counter checked; it is bumped by triggers on
+    foods, so order updates do not reread the catalog. Databases without the
+    counter fall back to rereading the rows and comparing them.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: Path of the SQLite database file
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._watcher = sqlite3.connect(db_path, check_same_thread=False)
+        self._data_version = None
+        self._catalog_version = None
+        self._snapshot = None
+
+    def _read_rows(self):
+        return get_pool().connection().execute(CATALOG_QUERY).fetchall()
+
+    def _read_catalog_version(self):
+        try:
+            return get_pool().connection().execute("SELECT version FROM catalog_version WHERE id = 1").fetchone()[0]
+        except (sqlite3.OperationalError, TypeError):
+            # Database without the counter (see db_migrations)
+            return None
+
+    def snapshot(self):
+        """
+        Return the current snapshot, refreshing it first if the database changed.
+        :return: CatalogSnapshot
+        """
+        with self._lock:
+            data_version = self._watcher.execute("PRAGMA data_version").fetchone()[0]
+            if self._snapshot is None or data_version != self._data_version:
+                catalog_version = self._read_catalog_version()
+                if self._snapshot is None or catalog_version is None or catalog_version != self._catalog_version:
+                    rows = self._read_rows()
+                    if self._snapshot is None or rows != self._snapshot.rows():
+                        self._snapshot = CatalogSnapshot(rows)
+                self._catalog_version = catalog_version
+                self._data_version = data_version
+            return self._snapshot
+
+    def invalidate(self):
+        """
+        Force the next snapshot call to reread the foods table.
+        """
+        with self._lock:
+            self._snapshot = None
+
+    def close(self):
+        self._watcher.close()
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """
+    Return the process-wide catalog for the pooled database, replacing it if
+    the pool was pointed at another file.
+    :return: Catalog
+    """
+    global _catalog
+    db_path = get_pool().db_path
+    with _catalog_lock:
+        if _catalog is None or _catalog.db_path != db_path:
+            if _catalog is not None:
+                _catalog.close()
+            _catalog = Catalog(db_path)
+        return _catalog
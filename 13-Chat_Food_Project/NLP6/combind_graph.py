@@ -1,3 +1,4 @@
+import asyncio
 from pydantic import BaseModel, Field
 from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph, START, END, MessagesState
@@ -5,6 +6,7 @@ from orders_graph import orders_graph_builder
 from suggestor_graph import suggestor_graph_builder
 from search_food_graph import search_food_graph_builder
 from food_information_graph import food_information_graph_builder
+from router import graph_router, route_cache
 from typing import TypedDict, Optional, Literal
 
 
@@ -18,14 +20,14 @@ def combined_graph_builder(gemini_chat, tbl, logger):
     class CombinedMyState(TypedDict):
         messages: str
 
-    def node_initial(state: CombinedMyState) -> CombinedMyState:
+    async def node_initial(state: CombinedMyState) -> CombinedMyState:
         """
         A placeholder function that returns the current state as it is.
         """
         logger.info("Node Initial function called.")
         return state
 
-    def node_other(state: CombinedMyState) -> CombinedMyState:
+    async def node_other(state: CombinedMyState) -> CombinedMyState:
         """
         If the clinet wanted something else.
         """
@@ -53,12 +55,11 @@ def combined_graph_builder(gemini_chat, tbl, logger):
         )
 
 
-    def combined_is_related(state: CombinedMyState) -> Literal["advanced_order_graph", "advanced_search_graph", "react_graph", "food_information_graph", "node_other"]:
-        query = state["messages"]
-        print(query)
-        logger.info("Determining the target relation for the query.")
-        logger.debug(f"User query: {query}")
-
+    async def llm_is_related(query):
+        """
+        Ask the LLM for the target node.
+        :return: The node name, or None if the LLM failed or answered something unexpected
+        """
         messages = [
             (
                 "system",
@@ -79,7 +80,7 @@ def combined_graph_builder(gemini_chat, tbl, logger):
             # Invoke the LLM with structured output
             # llm_with_structured_output = gemini_chat.with_structured_output(CombinedIsRelated)
             # print(f"\n\n{query.content}\n\n")
-            response = gemini_chat.invoke(messages)
+            response = await gemini_chat.ainvoke(messages)
             logger.info("Received response from LLM.")
             logger.debug(f"LLM response: {response}")
 
@@ -112,11 +113,37 @@ def combined_graph_builder(gemini_chat, tbl, logger):
             else:
                 logger.warning(f"Unexpected response flag: {response.content}. Defaulting to 'node_other'.")
                 print(6)
-                return "node_other"
+                return None
 
         except Exception as e:
             logger.error(f"Error while determining the target relation: {e}")
+            return None
+
+
+    async def combined_is_related(state: CombinedMyState) -> Literal["advanced_order_graph", "advanced_search_graph", "react_graph", "food_information_graph", "node_other"]:
+        query = state["messages"]
+        print(query)
+        logger.info("Determining the target relation for the query.")
+        logger.debug(f"User query: {query}")
+
+        # Most messages are routed locally; the LLM only sees the ambiguous ones
+        decision = await asyncio.to_thread(graph_router.route, query.content)
+        logger.debug(f"Local route: {decision}")
+        if decision.confident:
+            logger.info(f"Target node determined locally: {decision.route} (confidence {decision.confidence:.3f})")
+            return decision.route
+
+        # Reuse the LLM's decision for a message close enough to one it already routed
+        cached = await asyncio.to_thread(route_cache.get, "graph", query.content)
+        if cached is not None:
+            logger.info(f"Target node determined from the route cache: {cached}")
+            return cached
+
+        route = await llm_is_related(query)
+        if route is None:
             return "node_other"
+        await asyncio.to_thread(route_cache.put, "graph", query.content, route)
+        return route
 
 
     memory = MemorySaver()
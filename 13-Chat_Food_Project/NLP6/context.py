@@ -0,0 +1,137 @@
+import os
+
+from parser import SPLITTER_SETTINGS
+from retrieval import search
+
+
+# Rough size of the prompt context handed to the LLM; ~4 characters per token for English text
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+CHARS_PER_TOKEN = 4
+# Overlaps shorter than this are treated as coincidence, not splitter overlap
+MIN_OVERLAP = 16
+# A chunk is cut to fit the budget only if at least this many tokens of it still fit
+MIN_PARTIAL_TOKENS = 64
+
+CONTEXT_COLUMNS = ["text", "metadata_file_name", "metadata_pagenumber"]
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def overlap_length(head: str, tail: str, max_overlap: int = SPLITTER_SETTINGS["chunk_overlap"]) -> int:
+    """
+    Length of the longest suffix of head that is also a prefix of tail,
+    i.e. the text the splitter repeated between two neighbouring chunks.
+    :return: 0 if the overlap is shorter than MIN_OVERLAP
+    """
+    for size in range(min(len(head), len(tail), max_overlap), MIN_OVERLAP - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+
+def _trim_overlaps(text: str, kept: list) -> str:
+    # kept holds the texts already taken from the same page, in any order
+    for other in kept:
+        if text in other:
+            return ""
+        size = overlap_length(other, text)
+        if size:
+            text = text[size:]
+        size = overlap_length(text, other)
+        if size:
+            text = text[:-size]
+    return text.strip()
+
+
+def _cut(text: str, max_chars: int) -> str:
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > max_chars // 2 else cut).rstrip() + " ..."
+
+
+def _normalize_whitespace(text: str) -> str:
+    return " ".join(text.split())
+
+
+def pack_chunks(chunks, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Deduplicate ranked chunks and keep as many as fit in the token budget.
+    Exact duplicates are dropped and the splitter's overlap with chunks of the
+    same page that were already kept is trimmed off. The first chunk that does
+    not fit is cut at a word boundary if a useful part of it still fits.
+    :param chunks: (file name, page number, whitespace-normalized text) triples, best match first
+    :return: List of (page number or None, text) pairs
+    """
+    packed = []
+    kept_by_page = {}
+    seen = set()
+    remaining = token_budget
+
+    for file_name, page_number, text in chunks:
+        if not text or text in seen:
+            continue
+        seen.add(text)
+
+        kept = kept_by_page.setdefault((file_name, page_number), [])
+        trimmed = _trim_overlaps(text, kept)
+        kept.append(text)
+        if not trimmed:
+            continue
+
+        tokens = estimate_tokens(trimmed)
+        if tokens > remaining:
+            if remaining >= MIN_PARTIAL_TOKENS:
+                packed.append((page_number, _cut(trimmed, remaining * CHARS_PER_TOKEN)))
+            break
+        packed.append((page_number, trimmed))
+        remaining -= tokens
+
+    return packed
+
+
+def _arrow_chunks(results):
+    """
+    (file name, page number, text) triples read column-wise from a pyarrow.Table.
+    Whitespace is collapsed by Arrow compute kernels on the string buffers, and
+    only the text and metadata columns are converted to Python objects.
+    """
+    import pyarrow.compute as pc
+
+    for batch in results.to_batches():
+        texts = pc.utf8_trim_whitespace(pc.replace_substring_regex(batch.column("text"), r"\s+", " "))
+        file_names = batch.column("metadata_file_name").to_pylist() \
+            if "metadata_file_name" in batch.schema.names else [None] * batch.num_rows
+        pages = batch.column("metadata_pagenumber").to_pylist() \
+            if "metadata_pagenumber" in batch.schema.names else [None] * batch.num_rows
+        yield from zip(file_names, pages, texts.fill_null("").to_pylist())
+
+
+def format_context(results, token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Compact prompt context from retrieval results: only the chunk text and its
+    page number, without vectors, ids or DataFrame formatting.
+    :param results: pyarrow.Table from retrieval.search or a list of chunk dicts
+    :return: One '[p. N] text' paragraph per chunk, or '' if nothing was found
+    """
+    if hasattr(results, "to_batches"):
+        chunks = _arrow_chunks(results)
+    else:
+        chunks = ((row.get("metadata_file_name"), row.get("metadata_pagenumber"), _normalize_whitespace(row["text"]))
+                  for row in results)
+
+    return "\n\n".join(
+        f"[p. {page}] {text}" if page is not None else text
+        for page, text in pack_chunks(chunks, token_budget)
+    )
+
+
+def retrieve_context(tbl, query: str, query_type: str = "hybrid", limit: int = 10,
+                     token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Search the chunk table and format the hits as prompt context. Only
+    CONTEXT_COLUMNS are read from LanceDB, so vectors are never materialized.
+    """
+    return format_context(search(tbl, query, query_type=query_type, limit=limit, columns=CONTEXT_COLUMNS),
+                          token_budget)
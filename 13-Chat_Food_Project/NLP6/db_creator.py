@@ -1,8 +1,22 @@
+import hashlib
 import lancedb
 from lancedb.embeddings import get_registry
+from lancedb.index import FTS, IvfPq
 from lancedb.pydantic import LanceModel, Vector
 import pandas as pd
 
+from embeddings import NDIMS, get_backend
+
+
+TABLE_NAME = "embedded_chunks2"
+
+# Below this many rows a brute-force vector scan is already fast enough
+ANN_MIN_ROWS = 5000
+# Lance trains at most one IVF partition per this many rows, and no index on fewer
+ANN_MIN_ROWS_PER_PARTITION = 256
+# Retrain the IVF-PQ index once this share of rows was appended after it was built
+ANN_REBUILD_UNINDEXED_FRACTION = 0.2
+
 
 def df_to_dict_batches(df: pd.DataFrame, batch_size: int = 128):
     """
@@ -16,8 +30,114 @@ def df_to_dict_batches(df: pd.DataFrame, batch_size: int = 128):
         yield batch_dicts
 
 
-def df_to_dbtbl(db, df: pd.DataFrame):
-    embedding_model = get_registry().get("sentence-transformers").create(name="BAAI/bge-small-en-v1.5", device="cpu")
+def chunk_hash(record: dict) -> str:
+    """
+    Content address of a chunk: its text plus where it came from.
+    The parser's id_ is left out because it changes on every parse.
+    """
+    key = f"{record['metadata_file_name']}\0{record['metadata_pagenumber']}\0{record['text']}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def quoted_list(values):
+    return ", ".join("'" + value.replace("'", "''") + "'" for value in values)
+
+
+def _iter_records(data):
+    for item in data:
+        if isinstance(item, dict):
+            yield item
+        else:
+            # pyarrow RecordBatch or Table
+            yield from item.to_pylist()
+
+
+def iter_record_batches(data, batch_size: int = 128):
+    """
+    Yields lists of at most batch_size chunk dicts, each with its content_hash.
+    :param data: A DataFrame, an iterable of chunk dicts or an iterable of Arrow record batches;
+                 iterables are consumed lazily, so generators keep memory flat
+    """
+    if isinstance(data, pd.DataFrame):
+        data = df_to_dict_batches(data, batch_size=batch_size)
+        data = (record for batch in data for record in batch)
+
+    batch = []
+    for record in _iter_records(data):
+        if "content_hash" not in record:
+            record["content_hash"] = chunk_hash(record)
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sync_table(tbl, data, batch_size: int = 128, logger=None, file_names=None, prune: bool = False):
+    """
+    Add the chunks in data to an existing table, embedding only what is new.
+    Chunks are matched on content_hash: unseen hashes are embedded and appended
+    and unchanged chunks are left alone. With prune, hashes that are no longer in
+    data are deleted as well, but only for files that produced at least one chunk,
+    since a file without chunks means a failed parse rather than an empty file.
+    Only the hashes are kept in memory; chunks are written batch by batch as they arrive.
+    :param data: Chunks in any form accepted by iter_record_batches
+    :param file_names: Only treat chunks of these files as stale, so one file can be synced at a time
+    :param prune: Delete stored chunks that are not in data
+    :return: (number of added chunks, number of deleted chunks)
+    """
+    scope = None if file_names is None else f"metadata_file_name IN ({quoted_list(file_names)})"
+    stored = tbl.to_lance().to_table(columns=["content_hash", "metadata_file_name"], filter=scope)
+    # content_hash -> file the chunk came from
+    existing = dict(zip(stored.column("content_hash").to_pylist(), stored.column("metadata_file_name").to_pylist()))
+
+    def write(records):
+        # Vectors come from the shared backend, whatever embedder the table was created with
+        for record, vector in zip(records, get_backend().encode([record["text"] for record in records])):
+            record["vector"] = vector
+        tbl.add(records)
+        return len(records)
+
+    wanted = set()
+    parsed_files = set()
+    pending = []
+    added = 0
+    for batch in iter_record_batches(data, batch_size=batch_size):
+        for record in batch:
+            if record["content_hash"] in wanted:
+                continue
+            wanted.add(record["content_hash"])
+            parsed_files.add(record["metadata_file_name"])
+            if record["content_hash"] not in existing:
+                pending.append(record)
+        if len(pending) >= batch_size:
+            added += write(pending)
+            pending = []
+    if pending:
+        added += write(pending)
+
+    stale = []
+    if prune:
+        stale = sorted(content_hash for content_hash, file_name in existing.items()
+                       if content_hash not in wanted and file_name in parsed_files)
+        unparsed = sorted({file_name for file_name in existing.values()} - parsed_files)
+        if unparsed and logger is not None:
+            logger.warning(f"Table {tbl.name}: no chunks for {unparsed}; keeping their stored chunks.")
+    for start_idx in range(0, len(stale), 500):
+        tbl.delete(f"content_hash IN ({quoted_list(stale[start_idx:start_idx + 500])})")
+
+    if logger is not None:
+        logger.info(f"Table {tbl.name}: {added} chunks embedded, {len(stale)} removed, "
+                    f"{len(wanted) - added} unchanged.")
+    return added, len(stale)
+
+
+def chunk_schema():
+    """
+    The LanceModel of a chunk row; vectors are filled in by the shared bge-small backend.
+    """
+    embedding_model = get_registry().get("bge-small-backend").create()
 
     class ChunksOfData(LanceModel):
         id_: str
@@ -25,13 +145,103 @@ def df_to_dbtbl(db, df: pd.DataFrame):
         metadata_file_name: str
         metadata_creation_date: str
         metadata_pagenumber: int
+        content_hash: str
         vector: Vector(embedding_model.ndims()) = embedding_model.VectorField()
 
-    tbl = db.create_table(
-        "embedded_chunks2",
-        data=df_to_dict_batches(df, batch_size=10),
-        schema=ChunksOfData,
-    )
-    # tbl = db.open_table("embedded_chunks")
-    
+    return ChunksOfData
+
+
+def open_chunk_table(db, table_name: str = TABLE_NAME, logger=None):
+    """
+    Open the chunk table, creating it empty if it is missing or predates content_hash.
+    """
+    try:
+        tbl = db.open_table(table_name)
+    except ValueError:
+        # Missing table
+        pass
+    else:
+        if "content_hash" in tbl.schema.names:
+            return tbl
+        if logger is not None:
+            logger.warning(f"Table {table_name} has no content_hash column; rebuilding it once.")
+
+    return db.create_table(table_name, schema=chunk_schema(), mode="overwrite")
+
+
+def _indexes_by_column(tbl):
+    indexes = {}
+    for index in tbl.list_indices():
+        for column in index.columns:
+            indexes[column] = index
+    return indexes
+
+
+def _unindexed_fraction(tbl, index_name, num_rows):
+    try:
+        stats = tbl.index_stats(index_name)
+        return stats.num_unindexed_rows / max(num_rows, 1)
+    except Exception:
+        return 0.0
+
+
+def ensure_indexes(tbl, rebuild: bool = False, logger=None, ann_min_rows: int = ANN_MIN_ROWS):
+    """
+    Build the full-text index on text and, once the table is large enough, an
+    IVF-PQ cosine index on vector; later calls fold appended rows into them.
+    Appends are merged with optimize(), which is incremental. The IVF-PQ index is
+    only retrained when too many rows were added since its partitions were learned.
+    :param rebuild: Rebuild both indexes from scratch
+    :param ann_min_rows: Smallest table that gets an IVF-PQ index
+    """
+    num_rows = tbl.count_rows()
+    indexes = _indexes_by_column(tbl)
+    created = []
+
+    if rebuild or "text" not in indexes:
+        tbl.create_index("text", config=FTS(), replace=True)
+        created.append("fts")
+
+    if num_rows >= max(ann_min_rows, ANN_MIN_ROWS_PER_PARTITION) and (
+        rebuild
+        or "vector" not in indexes
+        or _unindexed_fraction(tbl, indexes["vector"].name, num_rows) > ANN_REBUILD_UNINDEXED_FRACTION
+    ):
+        num_partitions = min(int(num_rows ** 0.5), num_rows // ANN_MIN_ROWS_PER_PARTITION)
+        tbl.create_index(
+            "vector",
+            config=IvfPq(distance_type="cosine", num_partitions=num_partitions, num_sub_vectors=NDIMS // 16),
+            replace=True,
+        )
+        created.append("ivf_pq")
+
+    if len(created) < 2:
+        # Add rows appended since the last build to the indexes that were kept
+        tbl.optimize()
+
+    if logger is not None:
+        logger.info(f"Table {tbl.name}: {num_rows} rows, built indexes {created or 'none'}, others optimized.")
+
+
+def df_to_dbtbl(db, data, table_name: str = TABLE_NAME, mode: str = "incremental", batch_size: int = 512, logger=None,
+                prune: bool = False, file_names=None):
+    """
+    Create or update the chunk table.
+    :param data: A DataFrame, an iterable of chunk dicts (e.g. Llama_document_parser(stream=True))
+                 or an iterable of Arrow record batches
+    :param mode: 'incremental' reuses an existing table and only embeds changed chunks,
+                 'overwrite' re-embeds everything from scratch
+    :param batch_size: Chunks embedded and written per LanceDB add call
+    :param prune: In incremental mode, also delete stored chunks that are not in data
+    :param file_names: Only prune chunks of these files (optional)
+    """
+    if mode == "incremental":
+        tbl = open_chunk_table(db, table_name, logger=logger)
+    else:
+        tbl = db.create_table(table_name, schema=chunk_schema(), mode="overwrite")
+
+    added, deleted = sync_table(tbl, data, batch_size=batch_size, logger=logger, file_names=file_names, prune=prune)
+    if added or deleted or mode != "incremental":
+        ensure_indexes(tbl, logger=logger)
+
     return tbl
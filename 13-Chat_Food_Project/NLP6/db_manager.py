@@ -1,147 +1,373 @@
-import sqlite3
-import Levenshtein
-import atexit
+import heapq
+from dataclasses import dataclass
+from enum import Enum
+from typing import Optional
 
+from catalog import get_catalog
+from db_pool import get_pool
 
-# atexit.register(lambda: connection.close())
 
+# sort_by value -> ORDER BY clause pushed into the filter query
+SORT_ORDERS = {
+    "edit_distance": "",
+    "price": " ORDER BY price ASC, id ASC",
+    "price_desc": " ORDER BY price DESC, id ASC",
+}
 
 
-def food_search(food_name=None, restaurant_name=None, max_distance=1):
+def _filtered_positions(catalog, food_category=None, min_price=None, max_price=None, sort_by="edit_distance"):
+    """
+    Run the category and price filters in SQL and map the surviving ids onto catalog positions.
+    :param catalog: CatalogSnapshot to map ids onto
+    :param food_category: Category to keep, e.g. 'fast_food'; ignored if the catalog has no such category (optional)
+    :param min_price: Lowest price to keep (optional)
+    :param max_price: Highest price to keep (optional)
+    :param sort_by: One of SORT_ORDERS
+    :return: Catalog positions in the requested order, or None if nothing needs SQL
+    """
+    if sort_by not in SORT_ORDERS:
+        raise ValueError(f"sort_by must be one of {list(SORT_ORDERS)}, got '{sort_by}'.")
+    if food_category is not None:
+        # An unknown category would filter out everything, so it is dropped instead
+        food_category = catalog.resolve_category(food_category)
+    if food_category is None and min_price is None and max_price is None and sort_by == "edit_distance":
+        return None
+
+    clauses, params = [], []
+    if food_category is not None:
+        clauses.append("food_category = ?")
+        params.append(food_category)
+    if min_price is not None:
+        clauses.append("price >= ?")
+        params.append(min_price)
+    if max_price is not None:
+        clauses.append("price <= ?")
+        params.append(max_price)
+
+    query = "SELECT id FROM foods"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    query += SORT_ORDERS[sort_by]
+
+    cursor = get_pool().connection().execute(query, params)
+    # Rows committed after the snapshot was taken are left for the next refresh
+    return [catalog.positions_by_id[food_id] for food_id, in cursor if food_id in catalog.positions_by_id]
+
+
+def _collect_matches(catalog, food_matches, restaurant_matches, limit=None, order=None):
+    """
+    Turn per-field distance dicts into food_search's sorted result rows.
+    Rows are ordered by edit distance, ties by their position in the catalog,
+    unless an explicit order is given.
+    :param catalog: CatalogSnapshot the positions refer to
+    :param food_matches: Row position -> distance for the food name, or None if not searched
+    :param restaurant_matches: Row position -> distance for the restaurant name, or None if not searched
+    :param limit: Return only this many best matches (optional)
+    :param order: Catalog positions in the order to return them, e.g. sorted by price (optional)
+    :return: List of matching foods
+    """
+    if food_matches is not None and restaurant_matches is not None:
+        distances = {
+            position: min(distance, restaurant_matches[position])
+            for position, distance in food_matches.items()
+            if position in restaurant_matches
+        }
+    elif food_matches is not None:
+        distances = food_matches
+    elif restaurant_matches is not None:
+        distances = restaurant_matches
+    else:
+        distances = {}
+
+    def order_key(position):
+        return distances[position], position
+
+    if order is not None:
+        positions = [position for position in order if position in distances][:limit]
+    elif limit is None:
+        positions = sorted(distances, key=order_key)
+    else:
+        positions = heapq.nsmallest(limit, distances, key=order_key)
+
+    matches = []
+    for position in positions:
+        match = catalog.row(position)
+        match['edit_distance'] = distances[position]
+        matches.append(match)
+    return matches
+
+
+def food_search(food_name=None, restaurant_name=None, max_distance=1, limit=None,
+                food_category=None, min_price=None, max_price=None, sort_by="edit_distance"):
     """
     Search for foods based on food_name, restaurant_name, or both using edit distance.
-    :param connection: SQLite database connection
+    Category and price filters run in SQL first, so only the surviving rows are fuzzy matched.
     :param food_name: Food name to search for (optional)
     :param restaurant_name: Restaurant name to search for (optional)
     :param max_distance: Maximum allowed edit distance for a match
+    :param limit: Return only the top `limit` matches (optional)
+    :param food_category: Only return foods of this category, e.g. 'fast_food' or 'italian';
+                          a category the catalog does not have is ignored (optional)
+    :param min_price: Only return foods costing at least this much (optional)
+    :param max_price: Only return foods costing at most this much (optional)
+    :param sort_by: 'edit_distance' (closest first), 'price' or 'price_desc'
     :return: List of matching foods
     """
-    connection = sqlite3.connect('../Codes/food_orders.db')
+    catalog = get_catalog().snapshot()
+    positions = _filtered_positions(catalog, food_category, min_price, max_price, sort_by)
+    order = positions if sort_by != "edit_distance" else None
 
-    cursor = connection.cursor()
-    cursor.execute("SELECT id, food_name, food_category, restaurant_name, price FROM foods")
-    results = cursor.fetchall()
+    if not food_name and not restaurant_name:
+        # Filters alone list every surviving food; without them there is nothing to search
+        food_matches = dict.fromkeys(positions, 0) if positions is not None else None
+        restaurant_matches = None
+    elif (food_name and restaurant_name) or order is not None:
+        # The combined distance and the price order both need every match, so limit afterwards
+        food_matches = catalog.food_index.search(food_name, max_distance, positions=positions) if food_name else None
+        restaurant_matches = catalog.restaurant_index.search(restaurant_name, max_distance, positions=positions) if restaurant_name else None
+    else:
+        food_matches = catalog.food_index.search(food_name, max_distance, limit, positions) if food_name else None
+        restaurant_matches = catalog.restaurant_index.search(restaurant_name, max_distance, limit, positions) if restaurant_name else None
+    return _collect_matches(catalog, food_matches, restaurant_matches, limit, order)
 
-    matches = []
-    for food_id, db_food_name, food_category, db_restaurant_name, db_price in results:
-        food_name_distance = float('inf')
-        restaurant_name_distance = float('inf')
-
-        if food_name:
-            food_name_distance_1 = Levenshtein.distance(food_name.lower(), db_food_name.lower(), weights=(0, 1, 1))
-            food_name_distance_2 = Levenshtein.distance(food_name.lower(), db_food_name.lower(), weights=(1, 0, 1))
-            food_name_distance_3 = Levenshtein.distance(food_name.lower(), db_food_name.lower(), weights=(1, 1, 1))
-            food_name_distance = min(food_name_distance_1, food_name_distance_2, food_name_distance_3)
-            
-
-        if restaurant_name:
-            restaurant_name_distance_1 = Levenshtein.distance(restaurant_name.lower(), db_restaurant_name.lower(), weights=(0, 1, 1))
-            restaurant_name_distance_2 = Levenshtein.distance(restaurant_name.lower(), db_restaurant_name.lower(), weights=(1, 0, 1))
-            restaurant_name_distance_3 = Levenshtein.distance(restaurant_name.lower(), db_restaurant_name.lower(), weights=(1, 1, 1))
-            
-            restaurant_name_distance = min(restaurant_name_distance_1, restaurant_name_distance_2, restaurant_name_distance_3)
-            
-        if food_name and restaurant_name:
-            if food_name_distance <= max_distance and restaurant_name_distance <= max_distance:
-                matches.append({
-                    'id': food_id,
-                    'food_name': db_food_name,
-                    'food_category': food_category,
-                    'restaurant_name': db_restaurant_name,
-                    'price': db_price,
-                    'edit_distance': min(food_name_distance, restaurant_name_distance)
-                })
-        elif food_name:
-            if food_name_distance <= max_distance:
-                matches.append({
-                    'id': food_id,
-                    'food_name': db_food_name,
-                    'food_category': food_category,
-                    'restaurant_name': db_restaurant_name,
-                    'price': db_price,
-                    'edit_distance': food_name_distance
-                })
-        elif restaurant_name:
-            if restaurant_name_distance <= max_distance:
-                matches.append({
-                    'id': food_id,
-                    'food_name': db_food_name,
-                    'food_category': food_category,
-                    'restaurant_name': db_restaurant_name,
-                    'price': db_price,
-                    'edit_distance': restaurant_name_distance
-                })
-
-    matches.sort(key=lambda x: x['edit_distance'])
-    connection.close()
-    return matches
+
+def food_search_batch(queries, max_distance=1, workers=-1, limit=None):
+    """
+    Run food_search for many (food_name, restaurant_name) pairs at once.
+    Distinct names are scored against the catalog in one vectorized pass.
+    :param queries: Iterable of (food_name, restaurant_name) pairs; either may be None
+    :param max_distance: Maximum allowed edit distance for a match
+    :param workers: Threads used for the distance matrix (-1 uses every core)
+    :param limit: Return only the top `limit` matches per query (optional)
+    :return: One list of matching foods per query, in input order
+    """
+    queries = list(queries)
+    catalog = get_catalog().snapshot()
+
+    food_names = list(dict.fromkeys(food_name.lower() for food_name, _ in queries if food_name))
+    restaurant_names = list(dict.fromkeys(restaurant_name.lower() for _, restaurant_name in queries if restaurant_name))
+    food_results = dict(zip(food_names, catalog.food_index.search_many(food_names, max_distance, workers)))
+    restaurant_results = dict(zip(restaurant_names, catalog.restaurant_index.search_many(restaurant_names, max_distance, workers)))
+
+    return [
+        _collect_matches(
+            catalog,
+            food_results[food_name.lower()] if food_name else None,
+            restaurant_results[restaurant_name.lower()] if restaurant_name else None,
+            limit,
+        )
+        for food_name, restaurant_name in queries
+    ]
+
+
+class OrderOutcome(Enum):
+    """
+    What happened to an order operation.
+    """
+    OK = "ok"
+    NOT_FOUND = "not_found"
+    NOT_CANCELABLE = "not_cancelable"
+
+
+@dataclass(frozen=True)
+class OrderResult:
+    """
+    Structured result of cancel_order, comment_order and check_order_status.
+    :param outcome: OrderOutcome of the operation
+    :param order_id: ID of the order the operation was about
+    :param order_status: Status of the order after the operation, None if it does not exist
+    :param message: Human readable summary for logs and prompts
+    """
+    outcome: OrderOutcome
+    order_id: object
+    order_status: Optional[str] = None
+    message: str = ""
+
+    @property
+    def ok(self):
+        return self.outcome is OrderOutcome.OK
+
+    def __str__(self):
+        return self.message
 
 
 def cancel_order(order_id, phone_number):
     """
     Cancel an order if its status is 'preparation'.
-    :param connection: SQLite database connection
+    The status check and the update are one conditional UPDATE, so two
+    concurrent cancels cannot both see 'preparation'.
     :param order_id: ID of the order to cancel
-    :return: Result message
-    """
-    connection = sqlite3.connect('../Codes/food_orders.db')
-    cursor = connection.cursor()
-    
-    cursor.execute("SELECT status FROM food_orders WHERE id = ? AND person_phone_number = ?", (order_id,phone_number))
-    result = cursor.fetchone()
-    
+    :param phone_number: Phone number the order was placed with
+    :return: OrderResult
+    """
+    with get_pool().transaction() as cursor:
+        cursor.execute(
+            "UPDATE food_orders SET status = 'canceled' "
+            "WHERE id = ? AND person_phone_number = ? AND status = 'preparation' RETURNING status",
+            (order_id, phone_number),
+        )
+        if cursor.fetchone() is not None:
+            return OrderResult(OrderOutcome.OK, order_id, "canceled",
+                               f"Order ID {order_id} from {phone_number} has been successfully canceled.")
+
+        # Nothing was updated; find out why
+        cursor.execute("SELECT status FROM food_orders WHERE id = ? AND person_phone_number = ?", (order_id, phone_number))
+        result = cursor.fetchone()
+
     if result is None:
-        return f"Order ID {order_id} from {phone_number} does not exist."
-    
+        return OrderResult(OrderOutcome.NOT_FOUND, order_id, None,
+                           f"Order ID {order_id} from {phone_number} does not exist.")
+
     current_status = result[0]
-    
-    if current_status == "preparation":
-        cursor.execute("UPDATE food_orders SET status = 'canceled' WHERE id = ?", (order_id,))
-        connection.commit()
-        connection.close()
-        return f"Order ID {order_id} from {phone_number} has been successfully canceled."
-    else:
-        connection.close()
-        return f"Order ID {order_id} from {phone_number} cannot be canceled as it is in '{current_status}' status."
+    return OrderResult(OrderOutcome.NOT_CANCELABLE, order_id, current_status,
+                       f"Order ID {order_id} from {phone_number} cannot be canceled as it is in '{current_status}' status.")
 
 
 def comment_order(order_id, person_name ,comment):
     """
     Add or overwrite a comment for an order.
-    :param connection: SQLite database connection
     :param order_id: ID of the order to comment on
+    :param person_name: Name of the person leaving the comment
     :param comment: The comment to add or overwrite
-    :return: Result message
-    """
-    connection = sqlite3.connect('../Codes/food_orders.db')
-    cursor = connection.cursor()
-    
-    cursor.execute("SELECT id FROM food_orders WHERE id = ?", (order_id,))
-    result = cursor.fetchone()
-    
+    :return: OrderResult
+    """
+    with get_pool().transaction() as cursor:
+        cursor.execute("UPDATE food_orders SET comment = ? WHERE id = ? RETURNING status", (comment, order_id))
+        result = cursor.fetchone()
+
     if result is None:
-        return f"Order ID {order_id} does not exist."
-    
-    cursor.execute("UPDATE food_orders SET comment = ? WHERE id = ?", (comment, order_id))
-    connection.commit()
-    connection.close()
-    return f"Comment for Order ID {order_id} from {person_name} has been updated."
+        return OrderResult(OrderOutcome.NOT_FOUND, order_id, None, f"Order ID {order_id} does not exist.")
+
+    return OrderResult(OrderOutcome.OK, order_id, result[0],
+                       f"Comment for Order ID {order_id} from {person_name} has been updated.")
 
 
 def check_order_status(order_id):
     """
     Check the status of an order.
-    :param connection: SQLite database connection
     :param order_id: ID of the order to check
-    :return: Order status or an error message
-    """
-    connection = sqlite3.connect('../Codes/food_orders.db')
-    cursor = connection.cursor()
-    
-    cursor.execute("SELECT status FROM food_orders WHERE id = ?", (order_id,))
-    result = cursor.fetchone()
-    connection.close()
+    :return: OrderResult with the current status in order_status
+    """
+    result = get_pool().connection().execute("SELECT status FROM food_orders WHERE id = ?", (order_id,)).fetchone()
     if result is None:
-        return f"Order ID {order_id} does not exist."
-    
-    return f"Order ID {order_id} from is currently in '{result[0]}' status."
\ No newline at end of file
+        return OrderResult(OrderOutcome.NOT_FOUND, order_id, None, f"Order ID {order_id} does not exist.")
+
+    return OrderResult(OrderOutcome.OK, order_id, result[0],
+                       f"Order ID {order_id} is currently in '{result[0]}' status.")
+
+
+def _load_bulk_orders(cursor, orders, match_phone=False):
+    """
+    Stage the requested orders in a temp table and look them all up with one join.
+    The staged rows stay in bulk_orders until the next call, so the caller can join
+    against them again in the same transaction.
+    :param cursor: Cursor inside the bulk operation's transaction
+    :param orders: List of (order_id, phone_number) pairs
+    :param match_phone: Only match orders placed with the given phone number; a missing
+                        phone number then matches nothing
+    :return: Status of each requested order in input order, None where it does not exist
+    """
+    cursor.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS bulk_orders "
+        "(position INTEGER PRIMARY KEY, order_id INTEGER, phone_number TEXT)"
+    )
+    cursor.execute("DELETE FROM bulk_orders")
+    cursor.executemany(
+        "INSERT INTO bulk_orders (position, order_id, phone_number) VALUES (?, ?, ?)",
+        [(position, order_id, phone_number) for position, (order_id, phone_number) in enumerate(orders)],
+    )
+    phone_condition = "AND o.person_phone_number = b.phone_number " if match_phone else ""
+    cursor.execute(
+        "SELECT b.position, o.status FROM bulk_orders b "
+        "LEFT JOIN food_orders o ON o.id = b.order_id "
+        + phone_condition +
+        "ORDER BY b.position"
+    )
+    return [status for _, status in cursor.fetchall()]
+
+
+def cancel_orders(orders):
+    """
+    Cancel many orders in one transaction; only orders in 'preparation' are canceled.
+    An order is reported as canceled only if the UPDATE actually changed it.
+    :param orders: Iterable of (order_id, phone_number) pairs; a pair without a phone number is NOT_FOUND
+    :return: One OrderResult per pair, in input order
+    """
+    orders = list(orders)
+    results = []
+    with get_pool().transaction(immediate=True) as cursor:
+        statuses = _load_bulk_orders(cursor, orders, match_phone=True)
+
+        cursor.execute(
+            "UPDATE food_orders SET status = 'canceled' "
+            "WHERE status = 'preparation' AND id IN "
+            "(SELECT b.order_id FROM bulk_orders b WHERE b.phone_number = food_orders.person_phone_number) "
+            "RETURNING id"
+        )
+        canceled_ids = {order_id for order_id, in cursor.fetchall()}
+        # Match on the staged ids, which SQLite already converted like the UPDATE did ('05' -> 5)
+        cursor.execute("SELECT order_id FROM bulk_orders ORDER BY position")
+        staged_ids = [order_id for order_id, in cursor.fetchall()]
+        cursor.execute("DELETE FROM bulk_orders")
+
+    reported = set()
+    for (order_id, phone_number), current_status, key in zip(orders, statuses, staged_ids):
+        if current_status is None:
+            results.append(OrderResult(OrderOutcome.NOT_FOUND, order_id, None,
+                                       f"Order ID {order_id} from {phone_number} does not exist."))
+        elif key in canceled_ids and key not in reported:
+            reported.add(key)
+            results.append(OrderResult(OrderOutcome.OK, order_id, "canceled",
+                                       f"Order ID {order_id} from {phone_number} has been successfully canceled."))
+        else:
+            # A repeated id in the batch sees the cancel done by its first occurrence
+            current_status = "canceled" if key in canceled_ids else current_status
+            results.append(OrderResult(OrderOutcome.NOT_CANCELABLE, order_id, current_status,
+                                       f"Order ID {order_id} from {phone_number} cannot be canceled as it is in '{current_status}' status."))
+    return results
+
+
+def comment_orders(comments):
+    """
+    Add or overwrite the comments of many orders in one transaction.
+    :param comments: Iterable of (order_id, person_name, comment) triples
+    :return: One OrderResult per triple, in input order
+    """
+    comments = list(comments)
+    results = []
+    with get_pool().transaction(immediate=True) as cursor:
+        statuses = _load_bulk_orders(cursor, [(order_id, None) for order_id, _, _ in comments])
+
+        to_update = []
+        for (order_id, person_name, comment), current_status in zip(comments, statuses):
+            if current_status is None:
+                results.append(OrderResult(OrderOutcome.NOT_FOUND, order_id, None, f"Order ID {order_id} does not exist."))
+            else:
+                to_update.append((comment, order_id))
+                results.append(OrderResult(OrderOutcome.OK, order_id, current_status,
+                                           f"Comment for Order ID {order_id} from {person_name} has been updated."))
+
+        cursor.executemany("UPDATE food_orders SET comment = ? WHERE id = ?", to_update)
+        cursor.execute("DELETE FROM bulk_orders")
+    return results
+
+
+def check_orders_status(order_ids):
+    """
+    Check the status of many orders with one query.
+    :param order_ids: Iterable of order IDs
+    :return: One OrderResult per ID, in input order
+    """
+    order_ids = list(order_ids)
+    with get_pool().transaction() as cursor:
+        statuses = _load_bulk_orders(cursor, [(order_id, None) for order_id in order_ids])
+        cursor.execute("DELETE FROM bulk_orders")
+
+    results = []
+    for order_id, current_status in zip(order_ids, statuses):
+        if current_status is None:
+            results.append(OrderResult(OrderOutcome.NOT_FOUND, order_id, None, f"Order ID {order_id} does not exist."))
+        else:
+            results.append(OrderResult(OrderOutcome.OK, order_id, current_status,
+                                       f"Order ID {order_id} is currently in '{current_status}' status."))
+    return results
@@ -0,0 +1,98 @@
+import sqlite3
+
+
+# (version, description, statements); PRAGMA user_version records the last applied version
+MIGRATIONS = [
+    (1, "base schema", [
+        """CREATE TABLE IF NOT EXISTS food_orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    person_name TEXT NOT NULL,
+    person_phone_number TEXT NOT NULL,
+    status TEXT CHECK(status IN ('preparation', 'delivery', 'canceled', 'delivered')) NOT NULL,
+    order_description TEXT,
+    comment TEXT
+)""",
+        """CREATE TABLE IF NOT EXISTS foods (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    food_name TEXT NOT NULL,
+    food_category TEXT NOT NULL,
+    restaurant_name TEXT NOT NULL,
+    price REAL NOT NULL
+)""",
+    ]),
+    (2, "secondary indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_food_orders_phone ON food_orders (person_phone_number)",
+        "CREATE INDEX IF NOT EXISTS idx_food_orders_status ON food_orders (status)",
+        "CREATE INDEX IF NOT EXISTS idx_foods_name ON foods (food_name)",
+        "CREATE INDEX IF NOT EXISTS idx_foods_restaurant ON foods (restaurant_name)",
+        "CREATE INDEX IF NOT EXISTS idx_foods_category_price ON foods (food_category, price)",
+        "CREATE INDEX IF NOT EXISTS idx_foods_price ON foods (price)",
+    ]),
+    (3, "catalog version counter", [
+        """CREATE TABLE IF NOT EXISTS catalog_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)""",
+        "INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 0)",
+        """CREATE TRIGGER IF NOT EXISTS foods_insert_bumps_version AFTER INSERT ON foods
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END""",
+        """CREATE TRIGGER IF NOT EXISTS foods_update_bumps_version AFTER UPDATE ON foods
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END""",
+        """CREATE TRIGGER IF NOT EXISTS foods_delete_bumps_version AFTER DELETE ON foods
+BEGIN
+    UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+END""",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(connection):
+    """
+    :param connection: SQLite database connection
+    :return: Last migration version applied to the database
+    """
+    return connection.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(connection, target=LATEST_VERSION, logger=None):
+    """
+    Bring the database schema up to the target version.
+    Every statement is idempotent and the version check runs under the write
+    lock, so it is safe to call on every startup and from several processes.
+    :param connection: SQLite database connection
+    :param target: Version to migrate to
+    :param logger: Logger for applied migrations (optional)
+    :return: Schema version after migrating
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        version = schema_version(connection)
+        for migration_version, description, statements in MIGRATIONS:
+            if version < migration_version <= target:
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute(f"PRAGMA user_version = {migration_version}")
+                version = migration_version
+                if logger is not None:
+                    logger.info(f"Applied migration {migration_version}: {description}")
+        connection.execute("COMMIT")
+    except sqlite3.Error:
+        connection.execute("ROLLBACK")
+        raise
+    return version
+
+
+if __name__ == "__main__":
+    import sys
+    from db_pool import DEFAULT_DB_PATH
+
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
+    connection = sqlite3.connect(db_path)
+    print(f"{db_path}: schema version {schema_version(connection)} -> {migrate(connection)}")
+    connection.close()
@@ -0,0 +1,189 @@
+import os
+import sqlite3
+import threading
+import atexit
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from db_migrations import migrate
+
+
+DEFAULT_DB_PATH = os.environ.get("FOOD_ORDERS_DB", "../Codes/food_orders.db")
+# Threads that run database calls for async code; each keeps its own pooled connection
+DB_WORKERS = int(os.environ.get("DB_WORKERS", 8))
+
+# Applied to every new connection
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class ConnectionPool:
+    """
+    Hands out one long-lived SQLite connection per thread.
+    Connections keep their compiled statements (cached_statements), so the
+    same queries are not re-prepared on every call.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, cached_statements=256, timeout=5.0, run_migrations=True):
+        """
+        :param db_path: Path of the SQLite database file
+        :param cached_statements: Number of prepared statements kept per connection
+        :param timeout: Seconds to wait on a locked database
+        :param run_migrations: Bring the schema up to date when the first connection opens
+        """
+        self.db_path = db_path
+        self.run_migrations = run_migrations
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            # Each connection is only used by its own thread; close_all may run elsewhere
+            check_same_thread=False,
+        )
+        for pragma in PRAGMAS:
+            connection.execute(pragma)
+        return connection
+
+    def connection(self):
+        """
+        Return the calling thread's connection, opening it on first use.
+        :return: sqlite3.Connection
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            with self._lock:
+                if self._closed:
+                    raise sqlite3.ProgrammingError(f"Connection pool for {self.db_path} is closed.")
+                connection = self._connect()
+                if self.run_migrations and not self._connections:
+                    migrate(connection)
+                self._connections.append(connection)
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self, immediate=False):
+        """
+        Yield a cursor inside a transaction that commits on success and rolls back on error.
+        :param immediate: Take the write lock up front (BEGIN IMMEDIATE) for read-then-write batches
+        """
+        connection = self.connection()
+        cursor = connection.cursor()
+        try:
+            with connection:
+                if immediate:
+                    cursor.execute("BEGIN IMMEDIATE")
+                yield cursor
+        finally:
+            cursor.close()
+
+    def close_all(self):
+        """
+        Close every connection handed out by this pool.
+        """
+        with self._lock:
+            self._closed = True
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Return the process-wide pool, creating it with the configured path on first use.
+    :return: ConnectionPool
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+def configure(db_path, **kwargs):
+    """
+    Point the shared pool at another database file, closing the current one.
+    :param db_path: Path of the SQLite database file
+    :param kwargs: Extra ConnectionPool arguments
+    :return: The new ConnectionPool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+        _pool = ConnectionPool(db_path, **kwargs)
+    return _pool
+
+
+def close_pool():
+    """
+    Close the shared pool; the next get_pool call opens a fresh one.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+
+_executor = None
+
+
+def get_executor():
+    """
+    Return the bounded thread pool that runs blocking database work for async callers.
+    :return: ThreadPoolExecutor with DB_WORKERS threads
+    """
+    global _executor
+    if _executor is None:
+        with _pool_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+    return _executor
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Await a blocking database call (SQLite or LanceDB) without blocking the event loop.
+    At most DB_WORKERS calls run at once; the rest wait in the executor's queue.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor():
+    global _executor
+    with _pool_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+atexit.register(close_pool)
+atexit.register(shutdown_executor)
@@ -0,0 +1,230 @@
+import atexit
+import logging
+import os
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from lancedb.embeddings import TextEmbeddingFunction, register
+
+
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
+NDIMS = 384
+ONNX_CACHE_DIR = ".onnx_cache"
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBackend:
+    """
+    CPU embedder for bge-small used by both ingestion and query-time search.
+
+    backend:
+      'torch'     - plain sentence-transformers, the historical default
+      'onnx'      - the same weights run by onnxruntime
+      'onnx-int8' - dynamically int8-quantized ONNX weights, exported once into ONNX_CACHE_DIR
+    All three produce normalized 384-dim vectors, so they fit ChunksOfData.vector
+    and can search a table embedded by any of the others.
+    """
+
+    def __init__(self, backend="torch", batch_size=256, processes=1, model_name=MODEL_NAME):
+        """
+        :param backend: 'torch', 'onnx' or 'onnx-int8'
+        :param batch_size: Texts per forward pass
+        :param processes: Worker processes for large encode calls (1 encodes in-process)
+        """
+        if backend not in ("torch", "onnx", "onnx-int8"):
+            raise ValueError(f"Unknown embedding backend '{backend}'.")
+        self.backend = backend
+        self.batch_size = batch_size
+        self.processes = processes
+        self.model_name = model_name
+        self._model = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _load_int8_model(self):
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        save_dir = os.path.join(ONNX_CACHE_DIR, self.model_name.replace("/", "__"))
+        quantized_file = "model_qint8_avx2.onnx"
+        if not os.path.exists(os.path.join(save_dir, "onnx", quantized_file)):
+            logger.info(f"Exporting int8 ONNX weights of {self.model_name} to {save_dir}")
+            model = SentenceTransformer(self.model_name, backend="onnx", device="cpu")
+            model.save_pretrained(save_dir)
+            export_dynamic_quantized_onnx_model(model, "avx2", save_dir)
+        return SentenceTransformer(save_dir, backend="onnx", device="cpu",
+                                   model_kwargs={"file_name": f"onnx/{quantized_file}"})
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                if self.backend == "torch":
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+                elif self.backend == "onnx":
+                    self._model = SentenceTransformer(self.model_name, backend="onnx", device="cpu")
+                else:
+                    self._model = self._load_int8_model()
+            return self._model
+
+    def encode(self, texts):
+        """
+        :param texts: List of texts
+        :return: List of normalized vectors as lists of floats
+        """
+        if not texts:
+            return []
+        model = self.model
+        # A process pool only pays off once there are several batches to share out
+        if self.processes > 1 and len(texts) >= 2 * self.batch_size:
+            if self._pool is None:
+                self._pool = model.start_multi_process_pool(["cpu"] * self.processes)
+            vectors = model.encode_multi_process(texts, self._pool, batch_size=self.batch_size,
+                                                 normalize_embeddings=True)
+        else:
+            vectors = model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                   convert_to_numpy=True)
+        return vectors.tolist()
+
+    def embed_query(self, query):
+        """
+        :param query: Search text
+        :return: Normalized query vector as a list of floats
+        """
+        return self.encode([query])[0]
+
+    def close(self):
+        if self._pool is not None:
+            self._model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Return the process-wide embedding backend, configured from the environment
+    (EMBEDDING_BACKEND, EMBEDDING_BATCH_SIZE, EMBEDDING_PROCESSES) on first use.
+    :return: EmbeddingBackend
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = EmbeddingBackend(
+                backend=os.environ.get("EMBEDDING_BACKEND", "torch"),
+                batch_size=int(os.environ.get("EMBEDDING_BATCH_SIZE", 256)),
+                processes=int(os.environ.get("EMBEDDING_PROCESSES", 1)),
+            )
+        return _backend
+
+
+def configure(**kwargs):
+    """
+    Replace the shared backend, e.g. configure(backend="onnx-int8", batch_size=512, processes=4).
+    :return: The new EmbeddingBackend
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = EmbeddingBackend(**kwargs)
+    # Vectors from the previous backend may differ slightly
+    query_cache.clear()
+    return _backend
+
+
+def normalize_query(query):
+    """
+    Canonical form of a query for caching. bge-small's tokenizer is uncased and
+    ignores runs of whitespace, so these variants embed to the same vector.
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query vectors keyed by normalized query text.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query, embed):
+        """
+        :param query: Search text
+        :param embed: Function that embeds a normalized query on a miss
+        :return: Query vector as a list of floats
+        """
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None:
+                self._vectors.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+
+        # Embed outside the lock so one slow miss does not block cache hits
+        vector = tuple(embed(key))
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.maxsize:
+                self._vectors.popitem(last=False)
+        return list(vector)
+
+    def stats(self):
+        """
+        :return: Dict with hits, misses, hit_rate and the current size
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._vectors),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._vectors.clear()
+            self.hits = self.misses = 0
+
+
+query_cache = QueryEmbeddingCache(maxsize=int(os.environ.get("QUERY_CACHE_SIZE", 1024)))
+
+
+def embed_query(query):
+    """
+    Embed a search query with the shared backend, through the shared LRU cache.
+    """
+    return query_cache.get(query, lambda text: get_backend().embed_query(text))
+
+
+@register("bge-small-backend")
+class BackendEmbeddings(TextEmbeddingFunction):
+    """
+    LanceDB embedding function that delegates to the shared EmbeddingBackend, so
+    tables created with it embed rows and string queries the same way.
+    """
+    name: str = MODEL_NAME
+
+    def ndims(self):
+        return NDIMS
+
+    def generate_embeddings(self, texts):
+        return get_backend().encode(list(texts))
+
+
+atexit.register(lambda: _backend is not None and _backend.close())
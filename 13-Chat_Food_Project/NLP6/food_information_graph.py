@@ -1,3 +1,4 @@
+import asyncio
 from langgraph.graph import MessagesState
 from langchain_core.messages import HumanMessage, SystemMessage
 from langgraph.graph import START, StateGraph
@@ -5,11 +6,16 @@ from langgraph.prebuilt import tools_condition
 from langgraph.prebuilt import ToolNode
 from langgraph.checkpoint.memory import MemorySaver
 
+from context import retrieve_context
+from db_pool import run_db
+from embeddings import query_cache
+from retrieval import retrieval_cache
+
 i = 0
 def food_information_graph_builder(gemini_chat, memory, tbl, logger):
     results = []
 
-    def db_search_tool(query: str) -> str:
+    async def db_search_tool(query: str) -> str:
         """A clever tool to search in the DataBase to find professional details about a food.
         Args:
             query: The query to search for.
@@ -18,17 +24,17 @@ def food_information_graph_builder(gemini_chat, memory, tbl, logger):
         print("-----------Data Base SEARCHING Tool For Information----------")
         print("searching for", query)
 
-        context_list = tbl.search(query, query_type="hybrid").limit(5).to_list()
-        context = ''.join([f"{c['text']}\n\n" for c in context_list])
+        context = await run_db(retrieve_context, tbl, query, limit=5)
+        logger.debug(f"Query embedding cache: {query_cache.stats()}, retrieval cache: {retrieval_cache.stats()}")
 
         # print("results", results)
-        response = gemini_chat.invoke(f"This is the query:\n'{query}'\nAnswer base on the following context:\n{context}.")
+        response = await gemini_chat.ainvoke(f"This is the query:\n'{query}'\nAnswer base on the following context:\n{context}.")
 
         print("response", response)
 
         return response
 
-    def web_search_tool(query: str) -> str:
+    async def web_search_tool(query: str) -> str:
         """A very clever tool to search in the web to find professional details about a food.
         Args:
             query: The query to search for.
@@ -38,18 +44,16 @@ def food_information_graph_builder(gemini_chat, memory, tbl, logger):
         print("-----------Web SEARCHING Tool For Information----------")
         print("searching for", query)
         # results = TavilySearchResults(max_results=3).invoke(query)
-        results = client.search(
-        query=query
-    )
+        results = await asyncio.to_thread(client.search, query=query)
 
         # print("results", results)
-        response = gemini_chat.invoke(f"This is the query:\n'{query}'\nAnswer base on the following results:\n{results}.")
+        response = await gemini_chat.ainvoke(f"This is the query:\n'{query}'\nAnswer base on the following results:\n{results}.")
 
         print("response", response)
 
         return response
 
-    def food_info_reasoner(state: MessagesState):
+    async def food_info_reasoner(state: MessagesState):
         """
         Handles the reasoning process by invoking the LLM with tools based on the system message and user messages.
         """
@@ -77,7 +81,7 @@ def food_information_graph_builder(gemini_chat, memory, tbl, logger):
 
         # try:
         # Invoke the LLM with the combined messages
-        response = food_info_llm_with_tools.invoke(messages)
+        response = await food_info_llm_with_tools.ainvoke(messages)
         i+=1
 
         logger.info("Received response from LLM.")
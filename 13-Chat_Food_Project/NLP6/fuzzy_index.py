@@ -0,0 +1,190 @@
+from collections import Counter, defaultdict
+import heapq
+import math
+import Levenshtein
+import numpy as np
+from rapidfuzz.distance import Levenshtein as RapidLevenshtein
+from rapidfuzz.process import cdist
+
+
+# The weight settings combined by name_distance: free insertions, free deletions, plain
+DISTANCE_WEIGHTS = ((0, 1, 1), (1, 0, 1), (1, 1, 1))
+
+
+def name_distance(query, name, score_cutoff=None):
+    """
+    The edit distance used by food_search: the minimum of the insertion-free,
+    deletion-free and plain Levenshtein distances.
+    :param query: Lowercased query text
+    :param name: Lowercased name from the database
+    :param score_cutoff: Stop early once the distance exceeds this; the result is then score_cutoff + 1 (optional)
+    :return: Edit distance between the two
+    """
+    return min(
+        Levenshtein.distance(query, name, weights=weights, score_cutoff=score_cutoff)
+        for weights in DISTANCE_WEIGHTS
+    )
+
+
+class FuzzyNameIndex:
+    """
+    A prebuilt index over a column of names for max_distance-bounded lookups.
+
+    name_distance is never smaller than min(len(query), len(name)) minus the
+    number of characters the two strings share (counted with multiplicity),
+    so a character posting list gives a cheap lower bound for every distinct
+    name. Only names whose bound is within max_distance are verified with the
+    real distance, and each distinct name is verified once no matter how many
+    rows carry it.
+    """
+
+    def __init__(self, names):
+        """
+        :param names: Names in row order; row positions are the list indices
+        """
+        self._rows_by_name = defaultdict(list)
+        for position, name in enumerate(names):
+            self._rows_by_name[name.lower()].append(position)
+
+        self._names = list(self._rows_by_name)
+        name_ids = {name: name_id for name_id, name in enumerate(self._names)}
+        # row position -> name_id
+        self._name_of_row = [name_ids[name.lower()] for name in names]
+        self._lengths = [len(name) for name in self._names]
+
+        # character -> [(name_id, count of that character in the name)]
+        self._postings = defaultdict(list)
+        # length -> [name_id], for names too short to need a shared character
+        self._by_length = defaultdict(list)
+        for name_id, name in enumerate(self._names):
+            for char, count in Counter(name).items():
+                self._postings[char].append((name_id, count))
+            self._by_length[len(name)].append(name_id)
+
+    def __len__(self):
+        return len(self._names)
+
+    def _candidates(self, query, max_distance):
+        """
+        :return: Dict of name_id -> lower bound of its distance, for names that may be within max_distance
+        """
+        query_length = len(query)
+        if query_length <= max_distance:
+            # Every name is within reach of a query this short
+            return dict.fromkeys(range(len(self._names)), 0)
+
+        shared = defaultdict(int)
+        for char, query_count in Counter(query).items():
+            for name_id, name_count in self._postings.get(char, ()):
+                shared[name_id] += min(query_count, name_count)
+
+        candidates = {}
+        for name_id, count in shared.items():
+            bound = min(query_length, self._lengths[name_id]) - count
+            if bound <= max_distance:
+                candidates[name_id] = bound
+        # Names sharing no character are bounded only by their own length
+        for length, name_ids in self._by_length.items():
+            if length <= max_distance:
+                for name_id in name_ids:
+                    candidates.setdefault(name_id, length)
+        return candidates
+
+    def _cutoff(self, max_distance):
+        # No distance exceeds the longest name, so this also turns float('inf') into an integer
+        return math.floor(min(max_distance, max(self._lengths, default=0)))
+
+    def _rows(self, name, allowed):
+        rows = self._rows_by_name[name]
+        if allowed is None:
+            return rows
+        return [position for position in rows if position in allowed]
+
+    def search(self, query, max_distance=1, limit=None, positions=None):
+        """
+        Find every row whose name is within max_distance of the query.
+        :param query: Text to look up
+        :param max_distance: Maximum allowed edit distance for a match
+        :param limit: Keep only this many best rows, ordered by (distance, row position) (optional)
+        :param positions: Only consider these row positions, e.g. rows that passed SQL filters (optional)
+        :return: Dict of row position -> edit distance
+        """
+        if max_distance < 0 or (limit is not None and limit <= 0):
+            return {}
+
+        query = query.lower()
+        if positions is None:
+            allowed = None
+            candidates = self._candidates(query, max_distance)
+        else:
+            # A pre-filtered row set is usually small, so verify its names directly
+            allowed = set(positions)
+            candidates = dict.fromkeys((self._name_of_row[position] for position in allowed), 0)
+        cutoff = self._cutoff(max_distance)
+
+        if limit is None:
+            matches = {}
+            for name_id in candidates:
+                name = self._names[name_id]
+                distance = name_distance(query, name, cutoff)
+                if distance <= cutoff:
+                    for position in self._rows(name, allowed):
+                        matches[position] = distance
+            return matches
+
+        # Max-heap of the best rows so far, stored as (-distance, -position).
+        # Once it is full the worst kept distance becomes the new cutoff, and
+        # visiting names by ascending lower bound lets the loop stop early.
+        heap = []
+        for name_id in sorted(candidates, key=candidates.get):
+            if candidates[name_id] > cutoff:
+                break
+            name = self._names[name_id]
+            distance = name_distance(query, name, cutoff)
+            if distance > cutoff:
+                continue
+            for position in self._rows(name, allowed):
+                item = (-distance, -position)
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            if len(heap) == limit:
+                cutoff = -heap[0][0]
+        return {-position: -distance for distance, position in heap}
+
+    def search_many(self, queries, max_distance=1, workers=-1):
+        """
+        Look up many queries at once with one query-by-name distance matrix
+        per weight setting, computed by rapidfuzz's cdist on all cores.
+        :param queries: Texts to look up
+        :param max_distance: Maximum allowed edit distance for a match
+        :param workers: Threads used by cdist (-1 uses every core)
+        :return: One dict of row position -> edit distance per query, like search
+        """
+        queries = [query.lower() for query in queries]
+        if not queries or not self._names or max_distance < 0:
+            return [{} for _ in queries]
+
+        cutoff = self._cutoff(max_distance)
+        matrix = None
+        for weights in DISTANCE_WEIGHTS:
+            distances = cdist(
+                queries, self._names,
+                scorer=RapidLevenshtein.distance,
+                scorer_kwargs={"weights": weights},
+                score_cutoff=cutoff,
+                dtype=np.int32,
+                workers=workers,
+            )
+            matrix = distances if matrix is None else np.minimum(matrix, distances, out=matrix)
+
+        results = []
+        for row in matrix:
+            matches = {}
+            for name_id in np.flatnonzero(row <= cutoff):
+                distance = int(row[name_id])
+                for position in self._rows_by_name[self._names[name_id]]:
+                    matches[position] = distance
+            results.append(matches)
+        return results
@@ -0,0 +1,82 @@
+import glob
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from db_creator import TABLE_NAME, ensure_indexes, open_chunk_table, sync_table, quoted_list
+from parser import parse_file
+
+
+logger = logging.getLogger(__name__)
+
+
+def find_documents(directory: str, patterns=("*.pdf",)):
+    """
+    All files under directory matching any of the patterns, sorted for a stable order.
+    """
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    return sorted(paths)
+
+
+def ingest_documents(db, paths, table_name: str = TABLE_NAME, max_workers=None, offline: bool = False,
+                     prune: bool = False, logger=logger):
+    """
+    Parse and split documents in a process pool and sync each one into the chunk table.
+    Parsing runs in the worker processes while the main process embeds and writes
+    whichever file finished first, so the two stages overlap. Page numbers restart
+    for every file because each worker parses exactly one file.
+    :param paths: Documents to ingest
+    :param max_workers: Worker processes for parsing (defaults to the number of cores)
+    :param offline: Use local text extraction instead of LlamaParse
+    :param prune: Also remove stale chunks of changed files and chunks of files that are not in paths
+    :return: The chunk table
+    """
+    tbl = open_chunk_table(db, table_name, logger=logger)
+    file_names = [os.path.basename(path) for path in paths]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(parse_file, path, True, offline): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                chunks = future.result()
+            except Exception as e:
+                logger.error(f"Failed to parse {path}: {e}")
+                continue
+            sync_table(tbl, chunks, logger=logger, file_names=[os.path.basename(path)], prune=prune)
+
+    if prune and file_names:
+        tbl.delete(f"metadata_file_name NOT IN ({quoted_list(file_names)})")
+
+    ensure_indexes(tbl, logger=logger)
+
+    return tbl
+
+
+def ingest_directory(db, directory: str, patterns=("*.pdf",), **kwargs):
+    """
+    Ingest every matching document under directory; see ingest_documents for the options.
+    """
+    paths = find_documents(directory, patterns)
+    logger.info(f"Ingesting {len(paths)} documents from {directory}")
+    return ingest_documents(db, paths, **kwargs)
+
+
+if __name__ == "__main__":
+    import argparse
+    import lancedb
+
+    arg_parser = argparse.ArgumentParser(description="Ingest a directory of documents into LanceDB.")
+    arg_parser.add_argument("directory")
+    arg_parser.add_argument("--db", default=".lancedb")
+    arg_parser.add_argument("--workers", type=int, default=None)
+    arg_parser.add_argument("--offline", action="store_true")
+    arg_parser.add_argument("--prune", action="store_true",
+                            help="Delete stale chunks of changed files and chunks of files not in the directory")
+    args = arg_parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ingest_directory(lancedb.connect(args.db), args.directory, max_workers=args.workers,
+                     offline=args.offline, prune=args.prune)
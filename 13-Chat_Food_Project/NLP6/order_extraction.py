@@ -0,0 +1,210 @@
+import logging
+import re
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+
+logger = logging.getLogger(__name__)
+
+ORDER_ACTIONS = ("node_cancel_order", "node_comment_registeration", "node_order_status", "node_other")
+
+# Values LLMs use for "not mentioned"
+_EMPTY_VALUES = {"", "none", "null", "n/a", "na", "unknown", "not provided"}
+
+# 123-456-7890, (123) 456 7890, 123.456.7890, 1234567890, +1 123 456 7890
+PHONE_PATTERN = re.compile(r"(?<!\d)(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?!\d)")
+# Explicit id forms: 'order id 42', 'order id: 42', 'order number is 42', 'order no. 42', 'order #42', 'id 42', '#42'
+EXPLICIT_ORDER_ID_PATTERN = re.compile(
+    r"\b(?:order\s*(?:id|number|num|no\.?|#)|id)\s*(?:is\s*)?[:#]?\s*(\d{1,9})\b|#\s?(\d{1,9})\b",
+    re.IGNORECASE,
+)
+# A bare 'order 42', optionally followed by the next word
+BARE_ORDER_ID_PATTERN = re.compile(r"\border\s*:?\s*(\d{1,9})\b(?:\s+([a-z']+))?", re.IGNORECASE)
+# A bare 'order 3' is a quantity when a plural noun ('order 3 burgers') or one of these words follows it
+_QUANTITY_WORDS = {
+    "x", "more", "extra", "large", "medium", "small", "regular", "big", "pizza", "burger", "sandwich", "salad",
+    "wrap", "taco", "kebab", "soda", "coke", "coffee", "tea", "drink", "slice", "piece", "box", "bottle", "cup",
+    "plate", "portion", "serving",
+}
+# Words ending in 's' that are not plural nouns, e.g. 'order 12 is late'
+_NON_PLURAL_WORDS = {
+    "is", "was", "has", "does", "isn't", "wasn't", "hasn't", "doesn't", "this", "its", "it's", "yes", "thanks",
+    "status", "plus", "us", "as", "pls", "always", "perhaps", "unless", "address", "across",
+}
+
+# Slots each action needs before it can run without asking the LLM
+REQUIRED_SLOTS = {
+    "node_cancel_order": ("order_id", "phone_number"),
+    "node_comment_registeration": ("order_id", "person_name", "comment"),
+    "node_order_status": ("order_id",),
+    "node_other": (),
+}
+
+
+def normalize_phone_number(value: str) -> str:
+    """
+    Bring a phone number to the 123-456-7890 form used in food_orders.person_phone_number.
+    Numbers that are not 10 digits (11 with a leading 1) are only stripped.
+    """
+    digits = re.sub(r"\D", "", value)
+    if len(digits) == 11 and digits.startswith("1"):
+        digits = digits[1:]
+    if len(digits) == 10:
+        return f"{digits[:3]}-{digits[3:6]}-{digits[6:]}"
+    return value.strip()
+
+
+def _is_quantity_word(word: str) -> bool:
+    if word in _QUANTITY_WORDS:
+        return True
+    return word.endswith("s") and not word.endswith("ss") and word not in _NON_PLURAL_WORDS
+
+
+def _find_order_id(text: str):
+    """
+    :return: (order ID or None, whether it came from an explicit id form)
+    """
+    match = EXPLICIT_ORDER_ID_PATTERN.search(text)
+    if match is not None:
+        return int(match.group(1) or match.group(2)), True
+
+    for match in BARE_ORDER_ID_PATTERN.finditer(text):
+        follower = match.group(2)
+        if follower is None or not _is_quantity_word(follower.lower()):
+            return int(match.group(1)), False
+    return None, False
+
+
+def extract_order_slots(message: str) -> dict:
+    """
+    Find the order ID and phone number with regular expressions, without an LLM.
+    Phone numbers are removed before looking for the ID so their digits are never
+    mistaken for one. Explicit id forms ('order id 55', '#55') win over a bare
+    'order 55', and a bare one followed by a plural noun or a food word
+    ('order 3 burgers', 'order 1 pizza') is taken as a quantity and ignored.
+    :return: Dict with order_id (int or None), phone_number (normalized str or None)
+             and explicit_order_id (True if order_id came from an explicit id form)
+    """
+    phone_match = PHONE_PATTERN.search(message)
+    phone_number = normalize_phone_number(phone_match.group()) if phone_match else None
+
+    order_id, explicit = _find_order_id(PHONE_PATTERN.sub(" ", message))
+
+    return {"order_id": order_id, "phone_number": phone_number, "explicit_order_id": explicit}
+
+
+def is_empty(value) -> bool:
+    """
+    Whether an extracted value is one of the ways LLMs say "not mentioned", e.g. 'None' or 'n/a'.
+    """
+    return isinstance(value, str) and value.strip().strip("'\"").lower() in _EMPTY_VALUES
+
+
+def slot_value(value) -> str:
+    """
+    A slot as the order nodes store it: the value as a string, or 'None' if missing.
+    """
+    return "None" if value is None else str(value)
+
+
+class OrderRequest(BaseModel):
+    """
+    Everything the order flow needs from one message, extracted in a single call.
+    """
+    intent: Literal["node_cancel_order", "node_comment_registeration", "node_order_status", "node_other"] = Field(
+        description="What the client wants:\n"
+                    "'node_cancel_order': cancel an order.\n"
+                    "'node_comment_registeration': register a comment or opinion about an order.\n"
+                    "'node_order_status': know the status of an order.\n"
+                    "'node_other': anything else."
+    )
+    order_id: Optional[int] = Field(default=None, description="The order ID (a number), or null if it was not given.")
+    phone_number: Optional[str] = Field(default=None, description="The client's phone number, or null if it was not given.")
+    person_name: Optional[str] = Field(default=None, description="The client's name, or null if it was not given.")
+    comment: Optional[str] = Field(default=None, description="The comment about the order in the client's words, "
+                                                             "or null if there is no comment.")
+
+    @field_validator("phone_number", "person_name", "comment", mode="before")
+    @classmethod
+    def _empty_to_none(cls, value):
+        return None if is_empty(value) else value
+
+    @field_validator("order_id", mode="before")
+    @classmethod
+    def _parse_order_id(cls, value):
+        # One validator, so the empty check always runs before the digit check.
+        # Accept '#12', 'order 12' and the like; anything else without digits is invalid
+        if is_empty(value):
+            return None
+        if isinstance(value, str):
+            match = re.search(r"\d+", value)
+            if match is None:
+                raise ValueError(f"'{value}' is not an order ID")
+            return int(match.group())
+        return value
+
+    @field_validator("phone_number")
+    @classmethod
+    def _normalize_phone_number(cls, value):
+        return None if value is None else normalize_phone_number(value)
+
+    @field_validator("person_name", "comment")
+    @classmethod
+    def _strip(cls, value):
+        return None if value is None else value.strip().strip("'\"").strip() or None
+
+
+EXTRACTION_PROMPT = (
+    "Extract the client's request about a food order from the message: what they want to do (intent), "
+    "the order ID, phone number, name and the comment. Use null for anything that is not in the message."
+)
+
+
+async def extract_order_request(chat, message: str) -> Optional[OrderRequest]:
+    """
+    Extract intent and slots of an order message with one structured-output LLM call.
+    :param chat: The chat model
+    :return: Validated OrderRequest, or None if the call or the validation failed
+    """
+    try:
+        request = await chat.with_structured_output(OrderRequest).ainvoke([
+            ("system", EXTRACTION_PROMPT),
+            ("human", message),
+        ])
+        if isinstance(request, dict):
+            request = OrderRequest.model_validate(request)
+    except (ValidationError, ValueError) as e:
+        logger.warning(f"Order extraction returned an invalid result: {e}")
+        return None
+    except Exception as e:
+        logger.error(f"Order extraction failed: {e}")
+        return None
+
+    logger.info(f"Extracted order request: {request}")
+    return request
+
+
+async def resolve_order_request(chat, message: str, intent: Optional[str] = None) -> Optional[OrderRequest]:
+    """
+    Fill an OrderRequest with as few LLM calls as possible. The order ID and phone
+    number come from extract_order_slots; if the action is already known and needs
+    nothing else (e.g. a status check with an order ID), no LLM call is made.
+    Otherwise extract_order_request fills the rest; the regex phone number and
+    explicit order IDs, which are exact, replace the LLM's values.
+    :param intent: The action if it is already known, e.g. from the local router
+    :return: OrderRequest, or None if the LLM extraction was needed and failed
+    """
+    slots = extract_order_slots(message)
+    explicit_order_id = slots.pop("explicit_order_id")
+    if intent in REQUIRED_SLOTS and all(slots.get(name) is not None for name in REQUIRED_SLOTS[intent]):
+        logger.info(f"Order request resolved without the LLM: {intent}, {slots}")
+        return OrderRequest(intent=intent, **slots)
+
+    request = await extract_order_request(chat, message)
+    if request is None:
+        return None
+    # A bare 'order N' is only a guess, so it never replaces an id the LLM found
+    if request.order_id is not None and not explicit_order_id:
+        slots["order_id"] = None
+    return request.model_copy(update={name: value for name, value in slots.items() if value is not None})
@@ -1,9 +1,13 @@
+import asyncio
 from typing import TypedDict, Optional
 from pydantic import BaseModel, Field
 from typing import Literal
 from langgraph.graph import StateGraph, START, END, MessagesState
 
-from db_manager import cancel_order, comment_order, check_order_status
+from db_manager import cancel_order, comment_order, check_order_status, OrderOutcome
+from db_pool import run_db
+from order_extraction import ORDER_ACTIONS, extract_order_slots, resolve_order_request, slot_value
+from router import order_action_router, route_cache
 
 
 messages = []
@@ -31,13 +35,11 @@ def orders_graph_builder(gemini_chat, memory, logger):
         )
 
 
-    def is_related(state: MyState) -> Literal["node_cancel_order", "node_comment_registeration", "node_order_status", "node_other"]:
-        query = state["messages"]
-        print(query)
-
-        logger.info("Received query for determining node relation.")
-        logger.debug(f"User query: {query}")
-
+    async def llm_is_related(query):
+        """
+        Ask the LLM for the order action.
+        :return: The node name, or None if the LLM answered something unexpected
+        """
         # # Initialize the LLM with structured output
         # llm_with_structured_output = gemini_chat.with_structured_output(IsRelated)
 
@@ -55,7 +57,7 @@ def orders_graph_builder(gemini_chat, memory, logger):
         ]
 
         # Invoke the LLM to get a response
-        response = gemini_chat.invoke(messages)
+        response = await gemini_chat.ainvoke(messages)
         logger.info("Received response from LLM.")
         logger.debug(f"LLM response: {response}")
 
@@ -82,10 +84,40 @@ def orders_graph_builder(gemini_chat, memory, logger):
 
         # Log if an unexpected flag is received
         logger.warning(f"Unexpected response flag: {response.content}. Returning 'node_other' by default.")
-        return "node_other"
+        return None
+
 
+    async def is_related(state: MyState) -> Literal["node_cancel_order", "node_comment_registeration", "node_order_status", "node_other"]:
+        query = state["messages"]
+        print(query)
 
-    def node_initial(state: MyState) -> MyState:
+        logger.info("Received query for determining node relation.")
+        logger.debug(f"User query: {query}")
+
+        if state.get("related_node") in ORDER_ACTIONS:
+            logger.info(f"Selected node from the extracted request: {state['related_node']}")
+            return state["related_node"]
+
+        # Embedding work runs off the event loop
+        decision = await asyncio.to_thread(order_action_router.route, query.content)
+        logger.debug(f"Local route: {decision}")
+        if decision.confident:
+            logger.info(f"Selected node locally: {decision.route} (confidence {decision.confidence:.3f})")
+            return decision.route
+
+        cached = await asyncio.to_thread(route_cache.get, "order_action", query.content)
+        if cached is not None:
+            logger.info(f"Selected node from the route cache: {cached}")
+            return cached
+
+        route = await llm_is_related(query)
+        if route is None:
+            return "node_other"
+        await asyncio.to_thread(route_cache.put, "order_action", query.content, route)
+        return route
+
+
+    async def node_initial(state: MyState) -> MyState:
         """
         Gathers the Order ID for the next nodes.
         """
@@ -94,20 +126,46 @@ def orders_graph_builder(gemini_chat, memory, logger):
 
         logger.info(f"User query: {user_query}")
 
+        # Order IDs and phone numbers are read with regular expressions; when the local
+        # router is sure of the action and nothing else is needed, no LLM is called.
+        # Otherwise one structured call returns the action and every slot, so is_related
+        # and node_comment_registeration do not need calls of their own
+        decision = await asyncio.to_thread(order_action_router.route, user_query.content)
+        request = await resolve_order_request(gemini_chat, user_query.content,
+                                        decision.route if decision.confident else None)
+        if request is not None:
+            state["costumer_order_id"] = slot_value(request.order_id)
+            state["phone_number"] = slot_value(request.phone_number)
+            state["person_name"] = slot_value(request.person_name)
+            state["comment"] = slot_value(request.comment)
+            state["related_node"] = request.intent
+            return state
+
         details = f"Please extract the details from this text in this format: 'order_id,phone_number,person_name'. Please return None for each of them if it was not filled. Your output should be just the values, not order_id, phone_number and person_name words:\n\n{user_query}"
 
-        invoke = gemini_chat.invoke(details).content
+        invoke = (await gemini_chat.ainvoke(details)).content
         logger.info(f"Invoke response: {invoke}")
-        order_id, phone_number, person_name = invoke.split(",")
+        try:
+            order_id, phone_number, person_name = [value.strip() for value in invoke.split(",")]
+        except ValueError:
+            logger.error(f"Could not split the extracted details: {invoke}")
+            order_id, phone_number, person_name = "None", "None", "None"
+
+        slots = extract_order_slots(user_query.content)
+        if slots["order_id"] is not None and (slots["explicit_order_id"] or order_id == "None"):
+            order_id = slot_value(slots["order_id"])
+        if slots["phone_number"] is not None:
+            phone_number = slots["phone_number"]
 
         state["costumer_order_id"] = order_id
         state["phone_number"] = phone_number
         state["person_name"] = person_name
+        state["related_node"] = None
 
         return state
 
 
-    def node_cancel_order(state: MyState) -> MyState:
+    async def node_cancel_order(state: MyState) -> MyState:
         """
         Cancels an order if the client requests.
         """
@@ -132,25 +190,25 @@ def orders_graph_builder(gemini_chat, memory, logger):
             logger.warning("Order canceled failed; Please provide Phone Number too.")
             state["status"] = "not exist"
 
-        elif "delivered" in cancel_order(state["costumer_order_id"], state["phone_number"]):
-            logger.warning("Order canceled failed; Order is already delivered")
-            state["status"] = "delivered"
+        else:
+            result = await run_db(cancel_order, state["costumer_order_id"], state["phone_number"])
+            logger.info(result.message)
 
-        elif "not exist." in cancel_order(state["costumer_order_id"], state["phone_number"]):
-            logger.warning("Order canceled failed; Order not exists.")
-            state["status"] = "not exist"
+            if result.outcome is OrderOutcome.NOT_FOUND:
+                logger.warning("Order canceled failed; Order not exists.")
+                state["status"] = "not exist"
 
-        elif "canceled" in cancel_order(state["costumer_order_id"], state["phone_number"]):
-            logger.warning("Order is already canceled.")
-            state["status"] = "canceled"
+            elif result.outcome is OrderOutcome.NOT_CANCELABLE:
+                logger.warning(f"Order canceled failed; Order is already in '{result.order_status}' status.")
+                state["status"] = result.order_status
 
-        else:
-            logger.info("Order canceled successfully.")
-            state["status"] = "canceled"
+            else:
+                logger.info("Order canceled successfully.")
+                state["status"] = "canceled"
 
         return state
 
-    def node_comment_registeration(state: MyState) -> MyState:
+    async def node_comment_registeration(state: MyState) -> MyState:
         """
         Registers the client's idea about an order.
         """
@@ -164,13 +222,20 @@ def orders_graph_builder(gemini_chat, memory, logger):
             messages = [messages[-1]]
             node_states = [node_states[-1]]
 
-        comment = f"Please extract the comment from this text in this format: 'comment'. Please return None if it was not filled:\n\n{user_query}"
+        comment_prompt = f"Please extract the comment from this text in this format: 'comment'. Please return None if it was not filled:\n\n{user_query}"
 
-        invoke = gemini_chat.invoke(comment).content
+        if state.get("related_node"):
+            # Already extracted by node_initial
+            invoke = state["comment"]
+        else:
+            invoke = (await gemini_chat.ainvoke(comment_prompt)).content
         if invoke != "None" and state["costumer_order_id"] != "None":
             comment = invoke
             logger.info(f"Comment: {comment}")
-            logger.info(comment_order(state["costumer_order_id"], state["person_name"], comment))
+            result = await run_db(comment_order, state["costumer_order_id"], state["person_name"], comment)
+            logger.info(result.message)
+            if result.ok:
+                state["comment"] = comment
 
         elif state["person_name"] == "None":
             logger.warning("Comment Registration failed; Please provide your name.")
@@ -181,12 +246,11 @@ def orders_graph_builder(gemini_chat, memory, logger):
             comment = "None"
 
         else:
-            logger.info(comment_order(state["costumer_order_id"], state["person_name"], comment))
-            state["comment"] = comment
+            logger.warning("Comment Registration failed; Please provide your comment.")
 
         return state
 
-    def node_order_status(state: MyState) -> MyState:
+    async def node_order_status(state: MyState) -> MyState:
         """
         If the client wanted to be aware of the order status.
         """
@@ -200,14 +264,16 @@ def orders_graph_builder(gemini_chat, memory, logger):
             node_states = [node_states[-1]]
 
         if state["costumer_order_id"] != "None":
-            logger.info(f"Order Status: {check_order_status(state['costumer_order_id'])}")
+            result = await run_db(check_order_status, state["costumer_order_id"])
+            logger.info(f"Order Status: {result.message}")
+            state["status"] = result.order_status if result.ok else "not exist"
 
         else:
             logger.warning("Order status failed; Please provide your order ID.")
 
         return state
 
-    def node_other(state: MyState) -> MyState:
+    async def node_other(state: MyState) -> MyState:
         """
         If the client wanted something else.
         """
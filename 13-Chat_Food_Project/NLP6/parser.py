@@ -1,47 +1,209 @@
-from llama_parse import LlamaParse
-from llama_index.core import SimpleDirectoryReader
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import pandas as pd
 
-def Llama_document_parser() -> pd.DataFrame:
-    pdf_files = ["..\Codes\The New Complete Book of Foos.pdf"]
+
+PDF_FILES = [r"..\Codes\The New Complete Book of Foos.pdf"]
+CACHE_DIR = ".parse_cache"
+
+PARSER_SETTINGS = {"parser": "llama_parse", "result_type": "text"}
+SPLITTER_SETTINGS = {"chunk_size": 1024, "chunk_overlap": 64}
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(path: str) -> str:
+    """
+    sha256 of a file's bytes, read in 1 MB blocks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _settings_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def _creation_date(path: str) -> str:
+    # Same format llama-index puts in the creation_date metadata
+    return datetime.fromtimestamp(os.stat(path).st_ctime).strftime("%Y-%m-%d")
+
+
+def parse_with_llamaparse(path: str) -> pd.DataFrame:
+    """
+    Parse a PDF with the LlamaParse service; one row per page.
+    The API key is read from LLAMA_CLOUD_API_KEY.
+    :raises ValueError: If the key is missing or no text came back
+    """
+    from llama_parse import LlamaParse
+    from llama_index.core import SimpleDirectoryReader
+
+    api_key = os.environ.get("LLAMA_CLOUD_API_KEY")
+    if not api_key:
+        raise ValueError("LLAMA_CLOUD_API_KEY is not set")
+
     # set up parser
-    parser = LlamaParse(result_type="text", api_key="API KEY")
+    parser = LlamaParse(result_type=PARSER_SETTINGS["result_type"], api_key=api_key)
 
     file_extractor = {".pdf": parser}
 
-    data_for_parse = SimpleDirectoryReader(input_files=pdf_files, file_extractor=file_extractor)
+    data_for_parse = SimpleDirectoryReader(input_files=[path], file_extractor=file_extractor)
 
     documents = data_for_parse.load_data()
 
+    # LlamaParse swallows its own errors (ignore_errors=True) and returns nothing
+    if not any(doc.text.strip() for doc in documents):
+        raise ValueError(f"LlamaParse returned no text for {path}")
+
+    return pd.DataFrame([{
+        "id_": doc.id_,
+        "text": doc.text,
+        "metadata_file_name": doc.metadata["file_name"],
+        "metadata_creation_date": doc.metadata["creation_date"],
+        "metadata_pagenumber": page_number,
+    } for page_number, doc in enumerate(documents, start=1)])
+
+
+def parse_locally(path: str) -> pd.DataFrame:
+    """
+    Offline fallback: extract the text layer of a PDF with pypdf; one row per page.
+    """
+    from pypdf import PdfReader
+
+    file_name = os.path.basename(path)
+    creation_date = _creation_date(path)
+    content_hash = file_hash(path)
+
+    return pd.DataFrame([{
+        "id_": f"{content_hash[:16]}-{page_number}",
+        "text": page.extract_text() or "",
+        "metadata_file_name": file_name,
+        "metadata_creation_date": creation_date,
+        "metadata_pagenumber": page_number,
+    } for page_number, page in enumerate(PdfReader(path).pages, start=1)])
+
+
+def split_pages(pages: pd.DataFrame) -> pd.DataFrame:
+    """
+    Split every page into overlapping chunks, keeping the page's metadata.
+    """
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1024,
-        chunk_overlap=64,
+        chunk_size=SPLITTER_SETTINGS["chunk_size"],
+        chunk_overlap=SPLITTER_SETTINGS["chunk_overlap"],
         length_function=len,
         is_separator_regex=False,
     )
 
     documents_list = []
-    page_number = 0
-    last_doc = None
-    for doc in documents:
-        if last_doc is None or last_doc != doc.metadata["file_name"]:
-            page_number = 1
-            last_doc = doc.metadata["file_name"]
-        else:
-            page_number += 1
-
-        texts = text_splitter.split_text(doc.text)
+    for page in pages.to_dict(orient="records"):
+        texts = text_splitter.split_text(page["text"])
         for text in texts:
-            item = {}
-            item["id_"] = doc.id_
+            item = dict(page)
             item["text"] = text
-            item["metadata_file_name"] = doc.metadata["file_name"]
-            item["metadata_creation_date"] = doc.metadata["creation_date"]
-            item["metadata_pagenumber"] = page_number
             documents_list.append(item)
 
-    df = pd.DataFrame(documents_list)
+    return pd.DataFrame(documents_list, columns=list(pages.columns))
+
+
+def cache_paths(path: str, offline: bool = False, cache_dir: str = CACHE_DIR):
+    """
+    :return: (pages cache path, chunks cache path) for a file under the current settings
+    """
+    content_hash = file_hash(path)
+    parser_settings = {"parser": "pypdf"} if offline else PARSER_SETTINGS
+    pages_key = _settings_key(content_hash, parser_settings)
+    chunks_key = _settings_key(pages_key, SPLITTER_SETTINGS)
+    return (os.path.join(cache_dir, f"{pages_key}.pages.parquet"),
+            os.path.join(cache_dir, f"{chunks_key}.chunks.parquet"))
+
+
+def parse_file(path: str, use_cache: bool = True, offline: bool = False, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """
+    Parsed and split chunks of one file, served from the on-disk cache when possible.
+    The cache is keyed by the file's content hash and the parser/splitter settings,
+    and stores both the parsed pages and the chunks as Parquet.
+    :param offline: Skip LlamaParse and extract text locally
+    """
+    pages_path, chunks_path = cache_paths(path, offline, cache_dir)
+
+    if use_cache and os.path.exists(chunks_path):
+        chunks = pd.read_parquet(chunks_path)
+        if len(chunks):
+            logger.info(f"Parse cache hit for {path}")
+            return chunks
+        # Left by an older version that cached failed parses
+        logger.warning(f"Ignoring empty parse cache entry for {path}")
+
+    pages = pd.read_parquet(pages_path) if use_cache and os.path.exists(pages_path) else None
+    if pages is None or not pages["text"].str.strip().any():
+        if offline:
+            pages = parse_locally(path)
+        else:
+            try:
+                pages = parse_with_llamaparse(path)
+            except Exception as e:
+                logger.warning(f"LlamaParse failed for {path} ({e}); falling back to local text extraction.")
+                return parse_file(path, use_cache=use_cache, offline=True, cache_dir=cache_dir)
+
+    chunks = split_pages(pages)
+
+    if not len(chunks):
+        # Never cache an empty parse, or it would be served on every later run
+        logger.warning(f"No text could be extracted from {path}; not caching it.")
+        return chunks
+
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        pages.to_parquet(pages_path, index=False)
+        chunks.to_parquet(chunks_path, index=False)
+
+    return chunks
+
+
+def iter_chunks(pdf_files=None, use_cache: bool = True, offline: bool = False, batch_size: int = 1024):
+    """
+    Yields chunk records one by one, file by file.
+    Cached files are read from Parquet in batch_size row groups, so at most one
+    batch (or, on a cache miss, one file) is in memory at a time.
+    """
+    import pyarrow.parquet as pq
+
+    for path in pdf_files or PDF_FILES:
+        _, chunks_path = cache_paths(path, offline)
+        if use_cache and os.path.exists(chunks_path) and pq.ParquetFile(chunks_path).metadata.num_rows:
+            for batch in pq.ParquetFile(chunks_path).iter_batches(batch_size=batch_size):
+                yield from batch.to_pylist()
+        else:
+            yield from parse_file(path, use_cache, offline).to_dict(orient="records")
+
+
+def Llama_document_parser(pdf_files=None, use_cache: bool = True, offline: bool = False, max_workers=None,
+                          stream: bool = False):
+    """
+    Parsed chunks of every file as one DataFrame, or as a lazy generator of
+    chunk dicts when stream is True (see iter_chunks).
+    """
+    if stream:
+        return iter_chunks(pdf_files, use_cache, offline)
+
+    pdf_files = pdf_files or PDF_FILES
+
+    if len(pdf_files) > 1:
+        # One file per worker process; map keeps the input order
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            frames = list(pool.map(parse_file, pdf_files, repeat(use_cache), repeat(offline)))
+    else:
+        frames = [parse_file(path, use_cache, offline) for path in pdf_files]
+
+    df = pd.concat(frames, ignore_index=True)
 
     return df
-    
\ No newline at end of file
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from embeddings import embed_query, normalize_query
+
+
+class RetrievalCache:
+    """
+    TTL + LRU cache of search results keyed by (table, normalized query, query type, limit)
+    and the table version. Results are stored as Arrow tables, which are immutable
+    and safe to share. When a table's version moves on (new rows ingested) all of
+    its entries are dropped.
+    """
+
+    def __init__(self, maxsize=512, ttl=300.0):
+        """
+        :param maxsize: Maximum number of cached results
+        :param ttl: Seconds a result stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _check_version(self, table_name, version):
+        if self._versions.get(table_name) != version:
+            for key in [key for key in self._entries if key[0] == table_name]:
+                del self._entries[key]
+            self._versions[table_name] = version
+
+    def get(self, key, version):
+        """
+        :param key: (table name, normalized query, query type, limit, search knobs...)
+        :param version: Current version of the table
+        :return: Cached result or None
+        """
+        with self._lock:
+            self._check_version(key[0], version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        with self._lock:
+            if self._versions.get(key[0]) != version:
+                # The table changed while this result was being computed
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        :return: Dict with hits, misses, hit_rate and the current size
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self.hits = self.misses = 0
+
+
+retrieval_cache = RetrievalCache(
+    maxsize=int(os.environ.get("RETRIEVAL_CACHE_SIZE", 512)),
+    ttl=float(os.environ.get("RETRIEVAL_CACHE_TTL", 300)),
+)
+
+
+# IVF-PQ search knobs: partitions probed per query and the re-ranking factor
+# (refine_factor * limit candidates are re-scored with full vectors; None skips it)
+NPROBES = int(os.environ.get("SEARCH_NPROBES", 20))
+REFINE_FACTOR = int(os.environ["SEARCH_REFINE_FACTOR"]) if os.environ.get("SEARCH_REFINE_FACTOR") else None
+
+
+def run_search(tbl, query, query_type="hybrid", limit=10, nprobes=NPROBES, refine_factor=REFINE_FACTOR,
+               columns=None):
+    """
+    Run one uncached search; query vectors come from the shared embedding backend.
+    :param query_type: 'hybrid', 'vector' or 'fts'
+    :param nprobes: IVF partitions to probe (ignored without a vector index)
+    :param refine_factor: Re-rank refine_factor * limit candidates with full vectors (optional)
+    :param columns: Columns to read, e.g. ['text', 'metadata_pagenumber']; None reads every column,
+                    including the vectors
+    :return: pyarrow.Table of results
+    """
+    if query_type == "hybrid":
+        builder = tbl.search(query_type="hybrid").vector(embed_query(query)).text(query)
+    elif query_type == "vector":
+        builder = tbl.search(embed_query(query))
+    elif query_type == "fts":
+        builder = tbl.search(query, query_type="fts")
+    else:
+        raise ValueError(f"Unknown query_type '{query_type}'.")
+
+    if query_type != "fts":
+        builder = builder.nprobes(nprobes)
+        if refine_factor is not None:
+            builder = builder.refine_factor(refine_factor)
+    if columns is not None:
+        builder = builder.select(list(columns))
+    return builder.limit(limit).to_arrow()
+
+
+def search(tbl, query, query_type="hybrid", limit=10, nprobes=NPROBES, refine_factor=REFINE_FACTOR,
+           cache=retrieval_cache, columns=None):
+    """
+    Search the chunk table, reusing a cached result for the same normalized query
+    and parameters while the table version is unchanged and the TTL has not expired.
+    :return: pyarrow.Table of results
+    """
+    version = tbl.version
+    key = (tbl.name, normalize_query(query), query_type, limit, nprobes, refine_factor,
+           None if columns is None else tuple(columns))
+    results = cache.get(key, version)
+    if results is None:
+        results = run_search(tbl, query, query_type, limit, nprobes, refine_factor, columns)
+        cache.put(key, version, results)
+    return results
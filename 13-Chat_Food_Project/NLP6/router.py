@@ -0,0 +1,484 @@
+import atexit
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import numpy as np
+
+from embeddings import embed_query, get_backend, normalize_query
+
+
+logger = logging.getLogger(__name__)
+
+# A local decision is trusted when the best route is at least this similar to the
+# message and beats the runner-up route by the margin; otherwise the LLM decides.
+# Unset, both are calibrated on ROUTER_EVAL_FILE with the embedding backend in use
+ROUTER_THRESHOLD = float(os.environ["ROUTER_THRESHOLD"]) if os.environ.get("ROUTER_THRESHOLD") else None
+ROUTER_MARGIN = float(os.environ["ROUTER_MARGIN"]) if os.environ.get("ROUTER_MARGIN") else None
+# Calibration keeps as many labeled messages local as it can while at least this
+# share of the local decisions are right
+ROUTER_TARGET_ACCURACY = float(os.environ.get("ROUTER_TARGET_ACCURACY", 0.95))
+ROUTER_EVAL_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_eval.json")
+# Exemplars averaged per route; a few neighbours are steadier than the single closest one
+ROUTER_TOP_K = 3
+
+# A past LLM routing decision is reused for messages at least this similar to it.
+# Unset, it is calibrated on the cache_pairs of ROUTER_EVAL_FILE: the threshold ends
+# up this far above the most similar pair of messages that need different routes
+ROUTE_CACHE_THRESHOLD = float(os.environ["ROUTE_CACHE_THRESHOLD"]) if os.environ.get("ROUTE_CACHE_THRESHOLD") else None
+ROUTE_CACHE_GAP = 0.01
+ROUTE_CACHE_SIZE = int(os.environ.get("ROUTE_CACHE_SIZE", 1024))
+# JSON file the cache is loaded from and saved to; unset keeps it in memory only
+ROUTE_CACHE_PATH = os.environ.get("ROUTE_CACHE_PATH")
+
+
+# Labeled examples for combind_graph.combined_is_related
+GRAPH_EXEMPLARS = {
+    "advanced_order_graph": [
+        "I want to cancel my order",
+        "Please cancel order 12, my phone number is 123-456-7890",
+        "Where is my order?",
+        "What is the status of order 42?",
+        "Track my order",
+        "Has my order been delivered yet?",
+        "I want to leave a comment about my order",
+        "The food in my last order was cold, register my complaint",
+        "My name is Sara, order 7 was great, thanks",
+        "Cancel the pizza I ordered",
+    ],
+    "advanced_search_graph": [
+        "How much is the pepperoni pizza?",
+        "What is the price of the burger at Burger House?",
+        "Which restaurants have sushi?",
+        "Does Pizza Palace sell lasagna?",
+        "Show me the menu of Taco Town",
+        "Find chicken kebab under 10 dollars",
+        "What desserts are available and how much do they cost?",
+        "Is there any restaurant that serves falafel?",
+        "List the cheapest salads",
+        "What category is the caesar salad in?",
+    ],
+    "react_graph": [
+        "Suggest me something to eat",
+        "What should I have for dinner tonight?",
+        "Recommend a healthy lunch",
+        "I'm hungry, what do you suggest?",
+        "Can you suggest a spicy dish?",
+        "I feel like something sweet, any ideas?",
+        "Recommend a good vegetarian meal",
+        "What food would you suggest for a cold day?",
+        "Give me a suggestion for a light breakfast",
+        "What is a good food for after a workout?",
+    ],
+    "food_information_graph": [
+        "How many calories are in an avocado?",
+        "What vitamins are in carrots?",
+        "Is salmon a good source of omega-3?",
+        "How should I store fresh mushrooms?",
+        "What is the recipe for lasagna?",
+        "How do I cook brown rice?",
+        "Are eggs bad for cholesterol?",
+        "What are the health benefits of garlic?",
+        "Why do apples turn brown after cutting?",
+        "Is honey safe for babies?",
+    ],
+    "node_other": [
+        "Hello",
+        "Hi, how are you?",
+        "What's the weather like today?",
+        "Tell me a joke",
+        "Who won the football match yesterday?",
+        "Thank you, goodbye",
+        "What is the capital of France?",
+        "Can you help me with my homework?",
+        "How do I reset my password?",
+        "What time is it?",
+    ],
+}
+
+# Labeled examples for orders_graph.is_related
+ORDER_ACTION_EXEMPLARS = {
+    "node_cancel_order": [
+        "I want to cancel my order",
+        "Please cancel order 12, my phone number is 123-456-7890",
+        "Cancel the pizza I ordered",
+        "I don't want my order anymore",
+        "Stop my order 35 please",
+        "Can you call off my delivery?",
+    ],
+    "node_comment_registeration": [
+        "I want to leave a comment about my order",
+        "The food in my last order was cold, register my complaint",
+        "My name is Sara, order 7 was great, thanks",
+        "Add a note to order 15: the burger was delicious",
+        "I'd like to give feedback on my order",
+        "Please register my review for order 3",
+    ],
+    "node_order_status": [
+        "Where is my order?",
+        "What is the status of order 42?",
+        "Track my order",
+        "Has my order been delivered yet?",
+        "Is order 18 on its way?",
+        "How long until my food arrives?",
+    ],
+    "node_other": [
+        "I want to change my delivery address",
+        "Can I pay by card?",
+        "Do you have a loyalty program?",
+        "How do I place a new order?",
+        "Hello",
+        "What are your opening hours?",
+    ],
+}
+
+
+def load_router_eval(path: str = ROUTER_EVAL_FILE):
+    """
+    :return: Dict of router name ('graph', 'order_action') -> list of {"message": ..., "route": ...} dicts
+    """
+    with open(path, encoding="utf-8") as file:
+        data = json.load(file)
+    return {name: items for name, items in data.items() if name != "description"}
+
+
+def routing_quality(decisions, routes, threshold, margin):
+    """
+    Accuracy and coverage of a router on labeled messages.
+    :param decisions: (route, confidence, margin) per message, e.g. from IntentRouter.score_messages
+    :param routes: The right route per message
+    :return: (share of the confident decisions that are right, share of messages decided confidently)
+    """
+    confident = [route == expected for (route, confidence, lead), expected in zip(decisions, routes)
+                 if confidence >= threshold and lead >= margin]
+    accuracy = sum(confident) / len(confident) if confident else 1.0
+    return accuracy, len(confident) / len(routes) if routes else 0.0
+
+
+def calibrate_router(decisions, routes, target_accuracy=ROUTER_TARGET_ACCURACY, threshold=None, margin=None):
+    """
+    Pick the threshold and margin that decide the most labeled messages locally
+    while at least target_accuracy of those decisions are right; among equally
+    good pairs the strictest wins. Candidates are the observed scores and margins.
+    :param threshold: Keep this threshold and only calibrate the margin (optional)
+    :param margin: Keep this margin and only calibrate the threshold (optional)
+    :return: (threshold, margin); infinite values if no pair reaches the target, so nothing is decided locally
+    """
+    thresholds = [threshold] if threshold is not None else sorted({confidence for _, confidence, _ in decisions})
+    margins = [margin] if margin is not None else sorted({0.0} | {lead for _, _, lead in decisions})
+
+    best = None
+    for candidate_threshold in thresholds:
+        for candidate_margin in margins:
+            accuracy, coverage = routing_quality(decisions, routes, candidate_threshold, candidate_margin)
+            if coverage and accuracy >= target_accuracy:
+                key = (coverage, candidate_threshold, candidate_margin)
+                if best is None or key > best:
+                    best = key
+    if best is None:
+        return (threshold if threshold is not None else float("inf"),
+                margin if margin is not None else float("inf"))
+    return best[1], best[2]
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    route: str
+    confidence: float
+    margin: float
+    confident: bool
+
+
+class IntentRouter:
+    """
+    CPU intent router: the message's bge-small embedding is compared with
+    embeddings of labeled exemplars, and each route is scored by the mean cosine
+    similarity of its ROUTER_TOP_K closest exemplars. Exemplars are embedded once,
+    on first use; messages go through the shared query-embedding cache.
+    A threshold or margin that is not given is calibrated on labeled messages on
+    first use, so it fits whichever embedding backend is configured.
+    """
+
+    def __init__(self, exemplars, threshold=ROUTER_THRESHOLD, margin=ROUTER_MARGIN, top_k=ROUTER_TOP_K,
+                 calibration=None, target_accuracy=ROUTER_TARGET_ACCURACY):
+        """
+        :param exemplars: Dict of route -> list of example messages
+        :param threshold: Minimum route score for a confident decision; None calibrates it
+        :param margin: Minimum lead of the best route over the second best; None calibrates it
+        :param calibration: List of {"message": ..., "route": ...} dicts, required if threshold or margin is None
+        :param target_accuracy: Share of confident decisions on calibration that must be right
+        """
+        if (threshold is None or margin is None) and not calibration:
+            raise ValueError("IntentRouter needs calibration messages when threshold or margin is not given.")
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.margin = margin
+        self.top_k = top_k
+        self.calibration = calibration
+        self.target_accuracy = target_accuracy
+        self._routes = list(exemplars)
+        self._matrices = None
+        self._calibrated = threshold is not None and margin is not None
+        self._lock = threading.Lock()
+        self._calibration_lock = threading.Lock()
+
+    def _exemplar_matrices(self):
+        with self._lock:
+            if self._matrices is None:
+                self._matrices = [np.asarray(get_backend().encode(self.exemplars[route]), dtype=np.float32)
+                                  for route in self._routes]
+            return self._matrices
+
+    def _vector_scores(self, vector):
+        scores = {}
+        for route, matrix in zip(self._routes, self._exemplar_matrices()):
+            # Vectors are normalized, so the dot product is the cosine similarity
+            similarities = matrix @ vector
+            k = min(self.top_k, len(similarities))
+            scores[route] = float(np.partition(similarities, -k)[-k:].mean())
+        return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True))
+
+    def scores(self, message: str):
+        """
+        :return: Dict of route -> score, best route first
+        """
+        return self._vector_scores(np.asarray(embed_query(message), dtype=np.float32))
+
+    @staticmethod
+    def _best(scores):
+        # (best route, its score, its lead over the runner-up)
+        scores = list(scores.items())
+        route, confidence = scores[0]
+        return route, confidence, confidence - scores[1][1] if len(scores) > 1 else confidence
+
+    def score_messages(self, messages):
+        """
+        Score many messages with one batched embedding call, bypassing the query cache.
+        :return: (best route, confidence, margin) per message
+        """
+        vectors = np.asarray(get_backend().encode(list(messages)), dtype=np.float32)
+        return [self._best(self._vector_scores(vector)) for vector in vectors]
+
+    def calibrate(self):
+        """
+        Set the missing threshold and margin from the calibration messages.
+        """
+        with self._calibration_lock:
+            if self._calibrated:
+                return
+            routes = [item["route"] for item in self.calibration]
+            decisions = self.score_messages([item["message"] for item in self.calibration])
+            self.threshold, self.margin = calibrate_router(decisions, routes, self.target_accuracy,
+                                                           self.threshold, self.margin)
+            self._calibrated = True
+            accuracy, coverage = routing_quality(decisions, routes, self.threshold, self.margin)
+            logger.info(f"Router calibrated on {len(routes)} messages: threshold {self.threshold:.3f}, "
+                        f"margin {self.margin:.3f}, accuracy {accuracy:.3f}, coverage {coverage:.3f}")
+
+    def route(self, message: str) -> RouteDecision:
+        """
+        :return: RouteDecision; confident is False when the caller should ask the LLM
+        """
+        try:
+            if not self._calibrated:
+                self.calibrate()
+            route, confidence, margin = self._best(self.scores(message))
+        except Exception as e:
+            logger.error(f"Local routing failed: {e}")
+            return RouteDecision(route="", confidence=0.0, margin=0.0, confident=False)
+
+        return RouteDecision(route=route, confidence=confidence, margin=margin,
+                             confident=confidence >= self.threshold and margin >= self.margin)
+
+
+_router_eval = load_router_eval()
+graph_router = IntentRouter(GRAPH_EXEMPLARS, calibration=_router_eval["graph"])
+order_action_router = IntentRouter(ORDER_ACTION_EXEMPLARS, calibration=_router_eval["order_action"])
+
+
+def pair_similarities(pairs):
+    """
+    Cosine similarity of each labeled cache pair, embedded in one batch.
+    :param pairs: List of {"cached": ..., "query": ..., "same_route": ...} dicts
+    :return: numpy array with one similarity per pair
+    """
+    vectors = np.asarray(get_backend().encode([pair[key] for pair in pairs for key in ("cached", "query")]),
+                         dtype=np.float32)
+    return np.einsum("ij,ij->i", vectors[0::2], vectors[1::2])
+
+
+def calibrate_route_cache(similarities, same_route, gap=ROUTE_CACHE_GAP):
+    """
+    The lowest cache threshold that keeps every pair of messages with different
+    routes at least gap below it, so a cached route is never reused for them.
+    :param similarities: Similarity per labeled pair
+    :param same_route: Whether each pair needs the same route
+    :return: (threshold, share of the same-route pairs that would hit)
+    """
+    similarities = np.asarray(similarities, dtype=np.float32)
+    same_route = np.asarray(same_route, dtype=bool)
+    different = similarities[~same_route]
+    threshold = float(different.max()) + gap if len(different) else 1.0 - gap
+    hits = similarities[same_route] >= threshold
+    return threshold, float(hits.mean()) if len(hits) else 0.0
+
+
+class SemanticRouteCache:
+    """
+    Bounded LRU cache of routing decisions keyed by message embedding. A lookup
+    returns the route of the most similar cached message if the cosine similarity
+    reaches the threshold. Each router (namespace) has its own entries, and the
+    whole cache can be persisted as JSON so it survives restarts.
+    Without a threshold, it is calibrated on labeled message pairs on first use.
+    """
+
+    def __init__(self, maxsize=ROUTE_CACHE_SIZE, threshold=ROUTE_CACHE_THRESHOLD, path=ROUTE_CACHE_PATH,
+                 save_every=32, calibration=None):
+        """
+        :param maxsize: Maximum number of cached messages per namespace
+        :param threshold: Minimum cosine similarity for a hit; None calibrates it
+        :param path: JSON file to load from and save to (optional)
+        :param save_every: Save after this many new entries, besides at exit
+        :param calibration: List of {"cached": ..., "query": ..., "same_route": ...} dicts,
+                            required if threshold is None
+        """
+        if threshold is None and not calibration:
+            raise ValueError("SemanticRouteCache needs calibration pairs when threshold is not given.")
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.path = path
+        self.save_every = save_every
+        self.calibration = calibration
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._matrices = {}
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._calibration_lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    def calibrate(self):
+        """
+        Set a missing threshold from the calibration pairs.
+        """
+        with self._calibration_lock:
+            if self.threshold is not None:
+                return
+            threshold, hit_rate = calibrate_route_cache(pair_similarities(self.calibration),
+                                                        [pair["same_route"] for pair in self.calibration])
+            self.threshold = threshold
+            logger.info(f"Route cache calibrated on {len(self.calibration)} pairs: threshold {threshold:.3f}, "
+                        f"same-route hit rate {hit_rate:.3f}")
+
+    def _matrix(self, namespace):
+        # Stacked vectors of a namespace, rebuilt only after it changed
+        if namespace not in self._matrices:
+            entries = self._entries.get(namespace)
+            self._matrices[namespace] = (list(entries), np.asarray([entry[0] for entry in entries.values()],
+                                                                   dtype=np.float32)) if entries else None
+        return self._matrices[namespace]
+
+    def get(self, namespace: str, message: str):
+        """
+        :return: Cached route or None
+        """
+        try:
+            if self.threshold is None:
+                self.calibrate()
+            vector = np.asarray(embed_query(message), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Route cache lookup failed: {e}")
+            return None
+        with self._lock:
+            matrix = self._matrix(namespace)
+            if matrix is not None:
+                keys, vectors = matrix
+                similarities = vectors @ vector
+                best = int(similarities.argmax())
+                if similarities[best] >= self.threshold:
+                    self._entries[namespace].move_to_end(keys[best])
+                    self.hits += 1
+                    return self._entries[namespace][keys[best]][1]
+            self.misses += 1
+            return None
+
+    def put(self, namespace: str, message: str, route: str):
+        try:
+            vector = tuple(embed_query(message))
+        except Exception as e:
+            logger.error(f"Could not cache the route: {e}")
+            return
+        key = normalize_query(message)
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            entries[key] = (vector, route)
+            entries.move_to_end(key)
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+            self._matrices.pop(namespace, None)
+            self._unsaved += 1
+            save = self.path and self._unsaved >= self.save_every
+        if save:
+            self.save()
+
+    def load(self):
+        try:
+            with open(self.path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load the route cache from {self.path}: {e}")
+            return
+        with self._lock:
+            for namespace, items in data.items():
+                entries = self._entries.setdefault(namespace, OrderedDict())
+                for message, route, vector in items[-self.maxsize:]:
+                    entries[message] = (tuple(vector), route)
+            self._matrices.clear()
+        logger.info(f"Loaded {sum(map(len, data.values()))} cached routes from {self.path}")
+
+    def save(self):
+        """
+        Write the cache to path if anything was added since the last save.
+        """
+        with self._lock:
+            if not self.path or not self._unsaved:
+                return
+            data = {namespace: [[message, route, list(vector)] for message, (vector, route) in entries.items()]
+                    for namespace, entries in self._entries.items()}
+            self._unsaved = 0
+        # Write to a temporary file first so a crash never leaves a truncated cache
+        temp_path = f"{self.path}.tmp"
+        with self._save_lock:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(data, file)
+            os.replace(temp_path, self.path)
+
+    def stats(self):
+        """
+        :return: Dict with hits, misses, hit_rate and the number of cached messages
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": sum(len(entries) for entries in self._entries.values()),
+                "maxsize": self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self.hits = self.misses = 0
+
+
+route_cache = SemanticRouteCache(calibration=_router_eval["cache_pairs"])
+atexit.register(route_cache.save)
@@ -1,10 +1,16 @@
 from langgraph.graph import StateGraph, START, END, MessagesState
 from typing import TypedDict, Optional
 
+from catalog import get_catalog
 from db_manager import food_search
+from db_pool import run_db
+from order_extraction import is_empty
 
 
 def search_food_graph_builder(gemini_chat, memory, logger):
+    # Load the food catalog into memory before the first turn
+    get_catalog().snapshot()
+
     class MyState_Food_Search(TypedDict):
         messages: str
         food_id: Optional[str]
@@ -14,7 +20,7 @@ def search_food_graph_builder(gemini_chat, memory, logger):
         price: Optional[str]
         edit_distance: Optional[str]
 
-    def node_search_food(state: MyState_Food_Search) -> MyState_Food_Search:
+    async def node_search_food(state: MyState_Food_Search) -> MyState_Food_Search:
         """
         Gives the details of a food by its name or restaurant name.
         """
@@ -23,22 +29,39 @@ def search_food_graph_builder(gemini_chat, memory, logger):
         user_query = state["messages"]
         logger.debug(f"User query: {user_query}")
 
-        # Step 1: Ask LLM to extract food_name and restaurant_name
-        details = f"Please extract the food_name and the restaurant_name from this query in this format: food_name,restaurant_name. Please return None for each of them if it was not found.:\n\n{user_query}"
+        # Step 1: Ask LLM to extract food_name, restaurant_name and the filters
+        details = (f"Please extract the food_name, the restaurant_name, the food_category (like fast_food or italian_food) and the max_price "
+                   f"from this query in this format: food_name,restaurant_name,food_category,max_price. "
+                   f"Please return None for each of them if it was not found.:\n\n{user_query}")
         logger.debug(f"Sending request to LLM to extract details: {details}")
 
-        invoke = gemini_chat.invoke(details).content.strip()
+        invoke = (await gemini_chat.ainvoke(details)).content.strip()
         logger.info(f"LLM response for details extraction: {invoke}")
 
         try:
-            food_name, restaurant_name = invoke.split(",")
-            logger.debug(f"Extracted food_name: {food_name}, restaurant_name: {restaurant_name}")
+            food_name, restaurant_name, food_category, max_price = [value.strip() for value in invoke.split(",")]
+            logger.debug(f"Extracted food_name: {food_name}, restaurant_name: {restaurant_name}, "
+                         f"food_category: {food_category}, max_price: {max_price}")
         except ValueError as e:
             logger.error(f"Error splitting LLM response: {invoke}. Exception: {e}")
-            food_name, restaurant_name = "None", "None"
+            food_name, restaurant_name, food_category, max_price = "None", "None", "None", "None"
 
-        # Step 2: Perform search using extracted food_name and restaurant_name
-        matches = food_search(food_name, restaurant_name)
+        food_name, restaurant_name, food_category, max_price = [
+            None if is_empty(value) else value for value in (food_name, restaurant_name, food_category, max_price)]
+        try:
+            max_price = None if max_price is None else float(max_price.lstrip("$"))
+        except ValueError:
+            max_price = None
+
+        # Step 2: Perform search using extracted food_name and restaurant_name; filters run in SQL
+        matches = await run_db(
+            food_search,
+            food_name,
+            restaurant_name,
+            limit=10,
+            food_category=food_category,
+            max_price=max_price,
+        )
         logger.info(f"Search results for food_name '{food_name}' and restaurant_name '{restaurant_name}': {matches}")
 
         # Step 3: Generate response using search matches
@@ -47,7 +70,7 @@ def search_food_graph_builder(gemini_chat, memory, logger):
                           "Generate sentences and consider multiple details including the price if there were multiple matches.")
         logger.debug(f"Sending request to LLM to generate text: {generated_text}")
 
-        response = gemini_chat.invoke(generated_text).content
+        response = (await gemini_chat.ainvoke(generated_text)).content
         logger.info(f"Generated response from LLM: {response}")
 
         # Store or process response (currently just returning state as per the original code)
@@ -4,14 +4,22 @@ from langgraph.graph import START, StateGraph
 from langgraph.prebuilt import tools_condition
 from langgraph.prebuilt import ToolNode
 
+from catalog import get_catalog
+from context import retrieve_context
 from db_manager import food_search
+from db_pool import run_db
+from embeddings import query_cache
+from retrieval import retrieval_cache
 
 
 j = 0
 def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
+    # Load the food catalog into memory before the first turn
+    get_catalog().snapshot()
+
     results = []
 
-    def search_tool(query: str) -> str:
+    async def search_tool(query: str) -> str:
         """
         Search the database for the contents similar to the query.
         A very clever tool to get knowledge about foods.
@@ -27,29 +35,31 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
         # Simulating search and storing results
         try:
             # results = TavilySearchResults(max_results=3).invoke(query)
-            results = [tbl.search(query, query_type="hybrid").limit(10).to_pandas()]
-            logger.info(f"Search results retrieved: {results}")
+            results = await run_db(retrieve_context, tbl, query, limit=10)
+            logger.debug(f"Query embedding cache: {query_cache.stats()}, retrieval cache: {retrieval_cache.stats()}")
+            logger.info(f"Search results retrieved ({len(results)} characters of context)")
+            logger.debug(f"Search context: {results}")
         except Exception as e:
             logger.error(f"Error while searching the database: {e}")
             return "An error occurred while searching. Please try again later."
 
         # Generating the first response based on search results
-        response = gemini_chat.invoke(
+        response = (await gemini_chat.ainvoke(
             f"This is the query:\n'{query}'\nSuggest a good food based on the responses gotten from the database "
             f"(if there was nothing, suggest from yourself):\n{results}\n"
             "Do not let anybody know there was nothing in results."
-        ).content
+        )).content
         logger.info(f"LLM response for food suggestion: {response}")
 
         # Extracting the food name from the response
-        food_name = gemini_chat.invoke(
+        food_name = (await gemini_chat.ainvoke(
             f"This is the query:\n'{response}'\nFind the food name and return it in this format: food_name. "
             "Do not use the word 'food_name' and return 'None' if it was not mentioned."
-        ).content
+        )).content
         logger.info(f"Extracted food name: {food_name}")
 
         # Call the node_search_food function with the extracted food name
-        response_2 = node_search_food(food_name)
+        response_2 = await node_search_food(food_name)
         logger.info(f"Response from node_search_food: {response_2}")
 
         # Final response combining both outputs
@@ -58,7 +68,7 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
 
         return final_response
 
-    def node_search_food(query: str) -> str:
+    async def node_search_food(query: str) -> str:
         """
         A very powerful tool that gives the details of a food by its name or restaurant name.
 
@@ -73,7 +83,7 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
                   f"'food_name,restaurant_name'. Please return None for each of them if it was not found.:\n\n{query}")
         logger.debug(f"LLM request for extracting food details: {details}")
 
-        invoke = gemini_chat.invoke(details).content
+        invoke = (await gemini_chat.ainvoke(details)).content
         logger.info(f"LLM response for food and restaurant extraction: {invoke}")
 
         try:
@@ -84,7 +94,7 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
             food_name, restaurant_name = "None", "None"
 
         # Step 2: Search for matches
-        matches = food_search(food_name, restaurant_name)
+        matches = await run_db(food_search, food_name, restaurant_name, limit=10)
         logger.info(f"Search results for food_name '{food_name}' and restaurant_name '{restaurant_name}': {matches}")
 
         # Step 3: Generate a detailed response based on search results
@@ -94,7 +104,7 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
                           "Return 'No restaurant has this food currently' if it was not related to any matches.")
         logger.debug(f"LLM request for generating response: {generated_text}")
 
-        response = gemini_chat.invoke(generated_text).content
+        response = (await gemini_chat.ainvoke(generated_text)).content
         logger.info(f"Generated response from LLM: {response}")
 
         return response
@@ -108,7 +118,7 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
         )
     )
 
-    def reasoner(state: MessagesState):
+    async def reasoner(state: MessagesState):
         """
         Handles the reasoning process by invoking the LLM with tools based on the system message and user messages.
         """
@@ -131,7 +141,7 @@ def suggestor_graph_builder(gemini_chat, memory, tbl, logger):
         print(messages)
         try:
             # Invoke the LLM with the combined messages
-            response = llm_with_tools.invoke(messages)
+            response = await llm_with_tools.ainvoke(messages)
             logger.info("Received response from LLM.")
             logger.debug(f"LLM response: {response.content}")
             j+=1
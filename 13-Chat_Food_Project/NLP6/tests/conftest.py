@@ -0,0 +1,79 @@
+import hashlib
+import os
+import re
+import shutil
+import sys
+
+import numpy as np
+import pytest
+
+
+NLP6_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, NLP6_DIR)
+
+SAMPLE_DB = os.path.join(NLP6_DIR, "..", "Codes", "food_orders.db")
+
+
+@pytest.fixture
+def orders_db(tmp_path):
+    """
+    Point the shared pool at a fresh copy of the sample database.
+    :return: Path of the copy
+    """
+    import db_pool
+
+    path = str(tmp_path / "food_orders.db")
+    shutil.copy(SAMPLE_DB, path)
+    db_pool.configure(path)
+    yield path
+    db_pool.close_pool()
+
+
+class StubBackend:
+    """
+    Deterministic stand-in for bge-small: normalized hashed bag-of-words vectors,
+    so messages that share words are similar.
+    """
+    backend = "stub"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), 384), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[a-z0-9]+", text.lower()):
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % 384] += 1.0
+            vectors[row] /= np.linalg.norm(vectors[row]) or 1.0
+        return vectors.tolist()
+
+    def embed_query(self, query):
+        return self.encode([query])[0]
+
+
+@pytest.fixture
+def stub_embeddings(monkeypatch):
+    """
+    Make router embed with StubBackend instead of loading bge-small.
+    """
+    import router
+
+    backend = StubBackend()
+    monkeypatch.setattr(router, "get_backend", lambda: backend)
+    monkeypatch.setattr(router, "embed_query", backend.embed_query)
+    return backend
+
+
+@pytest.fixture(scope="session")
+def bge_small():
+    """
+    The shared bge-small backend; skips the test unless the model was already downloaded.
+    """
+    embeddings = pytest.importorskip("embeddings")
+    pytest.importorskip("sentence_transformers")
+    from huggingface_hub import try_to_load_from_cache
+
+    if not isinstance(try_to_load_from_cache(embeddings.MODEL_NAME, "config.json"), str):
+        pytest.skip(f"{embeddings.MODEL_NAME} is not in the Hugging Face cache")
+    try:
+        embeddings.get_backend().encode(["warm up"])
+    except Exception as e:
+        pytest.skip(f"bge-small is not available: {e}")
+    return embeddings.get_backend()
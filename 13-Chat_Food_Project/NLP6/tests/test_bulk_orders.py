@@ -0,0 +1,99 @@
+import shutil
+import sqlite3
+
+import db_pool
+from conftest import SAMPLE_DB
+from db_manager import (OrderOutcome, cancel_order, cancel_orders, check_order_status, check_orders_status,
+                        comment_order, comment_orders)
+
+
+def _orders(path, status=None):
+    query = "SELECT id, person_phone_number, status FROM food_orders"
+    if status is not None:
+        query += f" WHERE status = '{status}'"
+    with sqlite3.connect(path) as connection:
+        return connection.execute(query + " ORDER BY id").fetchall()
+
+
+def test_cancel_orders_cancels_only_matching_preparation_orders(orders_db):
+    (first_id, first_phone, _), (second_id, second_phone, _) = _orders(orders_db, "preparation")[:2]
+    other_id, other_phone, other_status = next(row for row in _orders(orders_db) if row[2] != "preparation")
+
+    results = cancel_orders([
+        (first_id, first_phone),
+        (str(first_id), first_phone),
+        (second_id, "000-000-0000"),
+        (other_id, other_phone),
+        (999999, first_phone),
+    ])
+
+    assert [result.outcome for result in results] == [
+        OrderOutcome.OK, OrderOutcome.NOT_CANCELABLE, OrderOutcome.NOT_FOUND,
+        OrderOutcome.NOT_CANCELABLE, OrderOutcome.NOT_FOUND,
+    ]
+    assert results[1].order_status == "canceled"
+    assert results[3].order_status == other_status
+
+    statuses = {order_id: status for order_id, _, status in _orders(orders_db)}
+    assert statuses[first_id] == "canceled"
+    assert statuses[second_id] == "preparation"
+
+
+def test_cancel_orders_without_phone_number_is_not_found(orders_db):
+    order_id, _, _ = _orders(orders_db, "preparation")[0]
+
+    [result] = cancel_orders([(order_id, None)])
+
+    assert result.outcome is OrderOutcome.NOT_FOUND
+    assert {row[0]: row[2] for row in _orders(orders_db)}[order_id] == "preparation"
+
+
+def test_cancel_orders_matches_single_cancels(orders_db, tmp_path):
+    rows = _orders(orders_db)
+    requests = [(order_id, phone) for order_id, phone, _ in rows[:20]] + [(rows[0][0], "000-000-0000"), (1234567, None)]
+    bulk = cancel_orders(requests)
+    bulk_statuses = _orders(orders_db)
+
+    # Replay the same requests one by one on a fresh copy
+    single_db = str(tmp_path / "single.db")
+    shutil.copy(SAMPLE_DB, single_db)
+    db_pool.configure(single_db)
+    single = [cancel_order(order_id, phone) for order_id, phone in requests]
+
+    assert [(r.outcome, r.order_status) for r in bulk] == [(r.outcome, r.order_status) for r in single]
+    assert bulk_statuses == _orders(single_db)
+
+
+def test_cancel_orders_reports_string_and_padded_ids(orders_db, tmp_path):
+    (first_id, first_phone, _), (second_id, second_phone, _), (third_id, third_phone, _) = \
+        _orders(orders_db, "preparation")[:3]
+    requests = [(f"0{first_id}", first_phone), (f" {second_id}", second_phone), (str(third_id), third_phone),
+                (f"00{first_id}", first_phone)]
+
+    bulk = cancel_orders(requests)
+    assert [(r.outcome, r.order_status) for r in bulk] == [
+        (OrderOutcome.OK, "canceled"), (OrderOutcome.OK, "canceled"), (OrderOutcome.OK, "canceled"),
+        (OrderOutcome.NOT_CANCELABLE, "canceled"),
+    ]
+
+    single_db = str(tmp_path / "single.db")
+    shutil.copy(SAMPLE_DB, single_db)
+    db_pool.configure(single_db)
+    single = [cancel_order(order_id, phone) for order_id, phone in requests]
+    assert [(r.outcome, r.order_status) for r in bulk] == [(r.outcome, r.order_status) for r in single]
+    assert _orders(orders_db) == _orders(single_db)
+
+
+def test_comment_and_status_bulk_match_single_calls(orders_db):
+    order_ids = [row[0] for row in _orders(orders_db)[:5]] + [999999]
+
+    statuses = check_orders_status(order_ids)
+    assert [(r.outcome, r.order_status, r.message) for r in statuses] == \
+        [(r.outcome, r.order_status, r.message) for r in map(check_order_status, order_ids)]
+
+    results = comment_orders([(order_id, "Sam", f"comment {order_id}") for order_id in order_ids])
+    assert [r.outcome for r in results] == [OrderOutcome.OK] * 5 + [OrderOutcome.NOT_FOUND]
+    with sqlite3.connect(orders_db) as connection:
+        comments = dict(connection.execute("SELECT id, comment FROM food_orders"))
+    assert all(comments[order_id] == f"comment {order_id}" for order_id in order_ids[:5])
+    assert comment_order(999999, "Sam", "x").outcome is OrderOutcome.NOT_FOUND
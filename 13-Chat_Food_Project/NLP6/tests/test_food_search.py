@@ -0,0 +1,29 @@
+import pytest
+
+from catalog import get_catalog
+from db_manager import food_search
+
+
+def test_resolve_category(orders_db):
+    catalog = get_catalog().snapshot()
+    assert catalog.resolve_category("italian_food") == "italian_food"
+    assert catalog.resolve_category(" Italian ") == "italian_food"
+    assert catalog.resolve_category("fast food") == "fast_food"
+    assert catalog.resolve_category("Middle-Eastern") == "middle_eastern"
+    assert catalog.resolve_category("'seafood'") == "seafood"
+    assert catalog.resolve_category("pizza") is None
+
+
+def test_category_filter_accepts_the_short_name(orders_db):
+    italian = food_search(food_category="italian_food")
+    assert italian and all(match["food_category"] == "italian_food" for match in italian)
+    assert food_search(food_category="Italian") == italian
+
+
+@pytest.mark.parametrize("category", ["pizza", "none", "nonexistent_food"])
+def test_unknown_category_is_ignored(orders_db, category):
+    # 'pizza under $10': the LLM may put the dish in the category slot
+    pizzas = food_search("pizza", max_price=10)
+    assert any(match["food_name"] == "Pizza" for match in pizzas)
+    assert all(match["price"] <= 10 for match in pizzas)
+    assert food_search("pizza", max_price=10, food_category=category) == pizzas
@@ -0,0 +1,171 @@
+import functools
+import random
+import sqlite3
+
+import Levenshtein
+import pytest
+
+from catalog import CATALOG_QUERY
+from fuzzy_index import FuzzyNameIndex
+
+
+MAX_DISTANCES = range(6)
+LIMITS = (None, 1, 3, 10)
+
+
+@functools.lru_cache(maxsize=None)
+def reference_distance(query, name):
+    # The distance of the original row-by-row food_search
+    return min(Levenshtein.distance(query.lower(), name.lower(), weights=weights)
+               for weights in ((0, 1, 1), (1, 0, 1), (1, 1, 1)))
+
+
+def reference_search(rows, food_name=None, restaurant_name=None, max_distance=1, limit=None):
+    """
+    The original food_search: scan every row, keep those within max_distance and
+    sort them stably by distance, so ties stay in table order.
+    """
+    matches = []
+    for food_id, db_food_name, food_category, db_restaurant_name, price in rows:
+        food_distance = reference_distance(food_name, db_food_name) if food_name else None
+        restaurant_distance = reference_distance(restaurant_name, db_restaurant_name) if restaurant_name else None
+        distances = [distance for distance in (food_distance, restaurant_distance) if distance is not None]
+        if distances and all(distance <= max_distance for distance in distances):
+            matches.append({
+                'id': food_id,
+                'food_name': db_food_name,
+                'food_category': food_category,
+                'restaurant_name': db_restaurant_name,
+                'price': price,
+                'edit_distance': min(distances),
+            })
+    matches.sort(key=lambda match: match['edit_distance'])
+    return matches if limit is None else matches[:limit]
+
+
+def mutate(name, rng, edits):
+    chars = list(name)
+    for _ in range(edits):
+        operation = rng.randrange(4)
+        position = rng.randrange(len(chars) + 1)
+        if operation == 0 or not chars:
+            chars.insert(position, rng.choice("abcdeiouxyz "))
+        elif operation == 1:
+            del chars[min(position, len(chars) - 1)]
+        elif operation == 2:
+            chars[min(position, len(chars) - 1)] = rng.choice("aeiouxz")
+        else:
+            chars = [char.upper() if rng.random() < 0.3 else char for char in chars]
+    return "".join(chars)
+
+
+def make_queries(names, count, seed):
+    rng = random.Random(seed)
+    queries = ["a", "x", "pizza", "Kebab", "sushi place", "zzzzzz", "the", " "]
+    while len(queries) < count:
+        queries.append(mutate(rng.choice(names), rng, rng.randrange(6)))
+    return queries
+
+
+@pytest.fixture(scope="module")
+def catalog_rows():
+    from conftest import SAMPLE_DB
+
+    connection = sqlite3.connect(SAMPLE_DB)
+    try:
+        return connection.execute(CATALOG_QUERY).fetchall()
+    finally:
+        connection.close()
+
+
+@pytest.fixture(scope="module")
+def names(catalog_rows):
+    return [row[1] for row in catalog_rows] + [row[3] for row in catalog_rows]
+
+
+def reference_index_search(distances, max_distance, limit=None, positions=None):
+    matches = sorted((distance, position) for position, distance in enumerate(distances)
+                     if distance <= max_distance and (positions is None or position in positions))
+    return {position: distance for distance, position in (matches if limit is None else matches[:limit])}
+
+
+def test_index_search_matches_a_linear_scan(names):
+    # Food and restaurant names together, so many rows share a name
+    index = FuzzyNameIndex([name.lower() for name in names])
+    rng = random.Random(1)
+    for query in make_queries(names, 400, seed=0):
+        distances = [reference_distance(query, name) for name in names]
+        positions = set(rng.sample(range(len(names)), 40))
+        for max_distance in MAX_DISTANCES:
+            for limit in LIMITS:
+                assert index.search(query, max_distance, limit) == \
+                    reference_index_search(distances, max_distance, limit), (query, max_distance, limit)
+                assert index.search(query, max_distance, limit, positions) == \
+                    reference_index_search(distances, max_distance, limit, positions), (query, max_distance, limit)
+
+
+def test_index_search_many_matches_a_linear_scan(names):
+    index = FuzzyNameIndex([name.lower() for name in names])
+    queries = make_queries(names, 400, seed=2)
+    distances = [[reference_distance(query, name) for name in names] for query in queries]
+    for max_distance in MAX_DISTANCES:
+        results = index.search_many(queries, max_distance)
+        for query, query_distances, result in zip(queries, distances, results):
+            assert result == reference_index_search(query_distances, max_distance), (query, max_distance)
+
+
+def test_fuzzy_index_handles_negative_and_fractional_distances(names):
+    index = FuzzyNameIndex([name.lower() for name in names])
+    query = names[0][:-1]
+    distances = [reference_distance(query, name) for name in names]
+    assert index.search(query, -1) == {} and index.search_many([query], -1) == [{}]
+    assert index.search(query, 1.5) == reference_index_search(distances, 1.5)
+    assert index.search_many([query], 1.5) == [reference_index_search(distances, 1.5)]
+    assert index.search(query, 1, limit=0) == {}
+
+
+def test_fuzzy_index_accepts_an_infinite_distance(names):
+    index = FuzzyNameIndex([name.lower() for name in names])
+    query = "pizza"
+    distances = [reference_distance(query, name) for name in names]
+    every_row = reference_index_search(distances, float("inf"))
+    assert len(every_row) == len(names)
+    assert index.search(query, float("inf")) == every_row
+    assert index.search(query, float("inf"), limit=5) == reference_index_search(distances, float("inf"), 5)
+    assert index.search_many([query], float("inf")) == [every_row]
+    assert FuzzyNameIndex([]).search(query, float("inf")) == {}
+
+
+def test_food_search_matches_the_original_scan(orders_db, catalog_rows):
+    from db_manager import food_search
+
+    food_names = [row[1] for row in catalog_rows]
+    restaurant_names = [row[3] for row in catalog_rows]
+    rng = random.Random(3)
+    for food_name in make_queries(food_names, 120, seed=4):
+        restaurant_name = mutate(rng.choice(restaurant_names), rng, rng.randrange(3))
+        for max_distance in MAX_DISTANCES:
+            for limit in LIMITS:
+                for query in ((food_name, None), (None, food_name), (food_name, restaurant_name)):
+                    assert food_search(*query, max_distance=max_distance, limit=limit) == \
+                        reference_search(catalog_rows, *query, max_distance=max_distance, limit=limit), \
+                        (query, max_distance, limit)
+
+
+def test_food_search_batch_matches_the_original_scan(orders_db, catalog_rows):
+    from db_manager import food_search_batch
+
+    food_names = [row[1] for row in catalog_rows]
+    restaurant_names = [row[3] for row in catalog_rows]
+    rng = random.Random(5)
+    queries = [(None, None)]
+    for food_name in make_queries(food_names, 150, seed=6):
+        restaurant_name = mutate(rng.choice(restaurant_names), rng, rng.randrange(3))
+        queries += [(food_name, None), (None, restaurant_name), (food_name, restaurant_name)]
+
+    for max_distance in MAX_DISTANCES:
+        for limit in LIMITS:
+            results = food_search_batch(queries, max_distance=max_distance, limit=limit)
+            for query, result in zip(queries, results):
+                assert result == reference_search(catalog_rows, *query, max_distance=max_distance, limit=limit), \
+                    (query, max_distance, limit)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from order_extraction import OrderRequest, extract_order_request
+
+
+@pytest.mark.parametrize("missing", ["None", "null", "N/A", "", "  'none' ", None])
+def test_missing_order_id_is_none(missing):
+    request = OrderRequest.model_validate({"intent": "node_order_status", "order_id": missing})
+    assert request.order_id is None
+
+
+@pytest.mark.parametrize("raw, expected", [("12", 12), ("#12", 12), ("order 12", 12), (12, 12)])
+def test_order_id_is_parsed(raw, expected):
+    assert OrderRequest.model_validate({"intent": "node_order_status", "order_id": raw}).order_id == expected
+
+
+def test_order_id_without_digits_is_invalid():
+    with pytest.raises(ValidationError):
+        OrderRequest.model_validate({"intent": "node_order_status", "order_id": "twelve"})
+
+
+def test_slots_are_normalized():
+    request = OrderRequest.model_validate({
+        "intent": "node_cancel_order",
+        "order_id": "null",
+        "phone_number": "(123) 456 7890",
+        "person_name": " 'Sara' ",
+        "comment": "None",
+    })
+    assert request.phone_number == "123-456-7890"
+    assert request.person_name == "Sara"
+    assert request.comment is None
+
+
+class _StructuredChat:
+    """Stands in for a chat model whose structured output returns a fixed dict."""
+
+    def __init__(self, result):
+        self.result = result
+
+    def with_structured_output(self, schema):
+        return self
+
+    async def ainvoke(self, messages):
+        return self.result
+
+
+def test_extract_order_request_accepts_llm_null_strings():
+    chat = _StructuredChat({"intent": "node_order_status", "order_id": "None", "phone_number": "null",
+                            "person_name": "N/A", "comment": "None"})
+    request = asyncio.run(extract_order_request(chat, "where is my order?"))
+    assert request is not None
+    assert request.order_id is None and request.phone_number is None
+
+
+def test_extract_order_request_rejects_unknown_intent():
+    assert asyncio.run(extract_order_request(_StructuredChat({"intent": "bogus"}), "hi")) is None
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from order_extraction import extract_order_slots, resolve_order_request
+
+
+@pytest.mark.parametrize("message, order_id, phone_number", [
+    ("status of order 42", 42, None),
+    ("cancel order #12 my phone is (123) 456-7890", 12, "123-456-7890"),
+    ("Order ID: 7, phone 1234567890", 7, "123-456-7890"),
+    ("call 987-654-3210 about order number 35", 35, "987-654-3210"),
+    ("my id is 15", 15, None),
+    ("whats up with #3?", 3, None),
+    ("order 12 is late", 12, None),
+    ("my order 2 pizzas never arrived, order id 55", 55, None),
+    ("cancel the order 3 burgers, id 17, phone 123-456-7890", 17, "123-456-7890"),
+    ("cancel order 12 phone 123-456-7890", 12, "123-456-7890"),
+    ("order 9 yesterday", 9, None),
+    ("status of order 42 today", 42, None),
+    ("order 7 was delicious", 7, None),
+    ("has order 64 shipped?", 64, None),
+    ("i want to order 3 burgers", None, None),
+    ("please order 1 pizza for me", None, None),
+    ("rate my order 5 stars", None, None),
+    ("I ordered 2 pizzas, number 555.666.7777", None, "555-666-7777"),
+])
+def test_extract_order_slots(message, order_id, phone_number):
+    slots = extract_order_slots(message)
+    assert slots["order_id"] == order_id
+    assert slots["phone_number"] == phone_number
+
+
+def test_explicit_forms_are_flagged():
+    assert extract_order_slots("order id 55")["explicit_order_id"]
+    assert extract_order_slots("#55")["explicit_order_id"]
+    assert not extract_order_slots("order 55")["explicit_order_id"]
+
+
+class _StructuredChat:
+    """Stands in for a chat model whose structured output returns a fixed dict."""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def with_structured_output(self, schema):
+        return self
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        return self.result
+
+
+def test_status_check_needs_no_llm_call():
+    chat = _StructuredChat({})
+    request = asyncio.run(resolve_order_request(chat, "status of order 42", "node_order_status"))
+    assert chat.calls == 0
+    assert request.order_id == 42
+
+
+def test_bare_order_number_does_not_replace_llm_id():
+    chat = _StructuredChat({"intent": "node_order_status", "order_id": 8})
+    request = asyncio.run(resolve_order_request(chat, "where is the order 5 that my friend placed, it's 8"))
+    assert request.order_id == 8
+
+
+def test_explicit_order_id_replaces_llm_id():
+    chat = _StructuredChat({"intent": "node_cancel_order", "order_id": 2, "phone_number": "123 456 7890"})
+    request = asyncio.run(resolve_order_request(chat, "my order 2 pizzas never arrived, order id 55"))
+    assert request.order_id == 55
+    assert request.phone_number == "123-456-7890"
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from router import ROUTE_CACHE_GAP, SemanticRouteCache, calibrate_route_cache, load_router_eval, pair_similarities
+
+
+def test_get_returns_the_route_of_a_similar_message(stub_embeddings):
+    cache = SemanticRouteCache(threshold=0.9)
+    cache.put("order_action", "Cancel my order", "node_cancel_order")
+
+    # Same words after normalization, so the stub embeds them identically
+    assert cache.get("order_action", "  cancel MY order ") == "node_cancel_order"
+    assert cache.get("order_action", "what payment methods do you accept?") is None
+    # Namespaces do not share entries
+    assert cache.get("graph", "cancel my order") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 1 / 3, "size": 1, "maxsize": cache.maxsize}
+
+
+def test_put_replaces_the_route_of_the_same_message(stub_embeddings):
+    cache = SemanticRouteCache(threshold=0.9)
+    cache.put("graph", "track my order", "node_other")
+    cache.put("graph", "Track my order", "advanced_order_graph")
+    assert cache.get("graph", "track my order") == "advanced_order_graph"
+    assert cache.stats()["size"] == 1
+
+
+def test_least_recently_used_message_is_evicted(stub_embeddings):
+    cache = SemanticRouteCache(maxsize=2, threshold=0.9)
+    cache.put("graph", "hello", "node_other")
+    cache.put("graph", "track my order", "advanced_order_graph")
+    # A hit makes 'hello' the most recently used
+    assert cache.get("graph", "hello") == "node_other"
+    cache.put("graph", "how much is the pizza", "advanced_search_graph")
+
+    assert cache.get("graph", "hello") == "node_other"
+    assert cache.get("graph", "track my order") is None
+    assert cache.get("graph", "how much is the pizza") == "advanced_search_graph"
+
+
+def test_clear(stub_embeddings):
+    cache = SemanticRouteCache(threshold=0.9)
+    cache.put("graph", "hello", "node_other")
+    cache.get("graph", "hello")
+    cache.clear()
+    assert cache.get("graph", "hello") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_cache_survives_a_restart(stub_embeddings, tmp_path):
+    path = str(tmp_path / "route_cache.json")
+    cache = SemanticRouteCache(threshold=0.9, path=path, save_every=2)
+    cache.put("graph", "hello", "node_other")
+    cache.put("order_action", "cancel my order", "node_cancel_order")
+    # save_every entries were added, so the cache is already on disk
+    with open(path, encoding="utf-8") as file:
+        assert {namespace: [item[:2] for item in items] for namespace, items in json.load(file).items()} == {
+            "graph": [["hello", "node_other"]],
+            "order_action": [["cancel my order", "node_cancel_order"]],
+        }
+
+    cache.put("graph", "track my order", "advanced_order_graph")
+    cache.save()
+    restarted = SemanticRouteCache(threshold=0.9, path=path)
+    assert restarted.get("graph", "track my order") == "advanced_order_graph"
+    assert restarted.get("order_action", "cancel my order") == "node_cancel_order"
+    assert restarted.stats()["size"] == 3
+
+
+def test_load_keeps_the_most_recent_entries(stub_embeddings, tmp_path):
+    path = str(tmp_path / "route_cache.json")
+    cache = SemanticRouteCache(threshold=0.9, path=path)
+    for message in ("hello", "track my order", "how much is the pizza"):
+        cache.put("graph", message, "route")
+    cache.save()
+
+    restarted = SemanticRouteCache(maxsize=2, threshold=0.9, path=path)
+    assert restarted.get("graph", "hello") is None
+    assert restarted.get("graph", "how much is the pizza") == "route"
+
+
+def test_broken_cache_file_is_ignored(stub_embeddings, tmp_path):
+    path = tmp_path / "route_cache.json"
+    path.write_text("{not json", encoding="utf-8")
+    cache = SemanticRouteCache(threshold=0.9, path=str(path))
+    assert cache.get("graph", "hello") is None
+
+
+def test_calibrate_route_cache():
+    similarities = [0.97, 0.95, 0.93, 0.90, 0.85]
+    same_route = [True, True, False, True, False]
+    threshold, hit_rate = calibrate_route_cache(similarities, same_route)
+    assert threshold == pytest.approx(0.93 + ROUTE_CACHE_GAP)
+    assert hit_rate == pytest.approx(2 / 3)
+
+
+def test_cache_needs_calibration_pairs_without_a_threshold():
+    with pytest.raises(ValueError):
+        SemanticRouteCache(threshold=None)
+
+
+def test_cache_calibrates_on_first_get(stub_embeddings):
+    pairs = load_router_eval()["cache_pairs"]
+    cache = SemanticRouteCache(threshold=None, calibration=pairs)
+    cache.put("order_action", "cancel my order", "node_cancel_order")
+    assert cache.get("order_action", "status of my order") is None
+    assert cache.threshold is not None
+
+    similarities = pair_similarities(pairs)
+    assert all(similarity < cache.threshold for similarity, pair in zip(similarities, pairs) if not pair["same_route"])
+
+
+def test_calibrated_cache_on_bge_small(bge_small):
+    pairs = load_router_eval()["cache_pairs"]
+    cache = SemanticRouteCache(threshold=None, calibration=pairs)
+    cache.calibrate()
+
+    cache.put("order_action", "cancel my order", "node_cancel_order")
+    assert cache.get("order_action", "status of my order") is None
+    for pair in pairs:
+        if not pair["same_route"]:
+            cache.clear()
+            cache.put("graph", pair["cached"], "route")
+            assert cache.get("graph", pair["query"]) is None, pair
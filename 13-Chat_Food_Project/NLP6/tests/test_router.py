@@ -0,0 +1,92 @@
+import math
+
+import pytest
+
+import router
+from router import (GRAPH_EXEMPLARS, ORDER_ACTION_EXEMPLARS, ROUTER_TARGET_ACCURACY, IntentRouter, calibrate_router,
+                    load_router_eval, routing_quality)
+
+
+EXEMPLARS = {"graph": GRAPH_EXEMPLARS, "order_action": ORDER_ACTION_EXEMPLARS}
+
+# (predicted route, confidence, margin) with the right routes below
+DECISIONS = [("a", 0.90, 0.20), ("b", 0.85, 0.01), ("a", 0.70, 0.10), ("c", 0.60, 0.30), ("b", 0.50, 0.05)]
+ROUTES = ["a", "a", "a", "b", "b"]
+
+
+def test_routing_quality():
+    assert routing_quality(DECISIONS, ROUTES, 0.70, 0.10) == (1.0, 0.4)
+    assert routing_quality(DECISIONS, ROUTES, 0.0, 0.0) == (0.6, 1.0)
+    # Nothing decided locally is never wrong
+    assert routing_quality(DECISIONS, ROUTES, 0.95, 0.0) == (1.0, 0.0)
+
+
+def test_calibrate_router_keeps_the_most_messages_local_at_the_target():
+    assert calibrate_router(DECISIONS, ROUTES, target_accuracy=1.0) == (0.70, 0.10)
+    # 3 of 4 right is enough; the strictest pair of those covering 4 messages wins
+    assert calibrate_router(DECISIONS, ROUTES, target_accuracy=0.75) == (0.50, 0.05)
+
+
+def test_calibrate_router_keeps_given_values():
+    assert calibrate_router(DECISIONS, ROUTES, target_accuracy=1.0, threshold=0.80) == (0.80, 0.20)
+    assert calibrate_router(DECISIONS, ROUTES, target_accuracy=1.0, margin=0.0) == (0.90, 0.0)
+
+
+def test_calibrate_router_decides_nothing_locally_if_the_target_is_out_of_reach():
+    threshold, margin = calibrate_router([("b", 0.9, 0.5)], ["a"], target_accuracy=0.95)
+    assert math.isinf(threshold) and math.isinf(margin)
+
+
+def test_router_eval_covers_every_route_without_reusing_exemplars():
+    data = load_router_eval()
+    for name, exemplars in EXEMPLARS.items():
+        messages = [item["message"] for item in data[name]]
+        assert {item["route"] for item in data[name]} == set(exemplars)
+        assert len(messages) == len(set(messages))
+        assert not set(messages) & {message for examples in exemplars.values() for message in examples}
+
+
+def test_router_needs_calibration_messages_without_a_threshold():
+    with pytest.raises(ValueError):
+        IntentRouter(ORDER_ACTION_EXEMPLARS, threshold=None, margin=0.05)
+    IntentRouter(ORDER_ACTION_EXEMPLARS, threshold=0.8, margin=0.05)
+
+
+def test_router_calibrates_on_first_route(stub_embeddings):
+    items = load_router_eval()["order_action"]
+    intent_router = IntentRouter(ORDER_ACTION_EXEMPLARS, threshold=None, margin=None, calibration=items)
+    assert intent_router.threshold is None
+
+    decision = intent_router.route("please cancel my order 12")
+    assert intent_router.threshold is not None and intent_router.margin is not None
+    assert decision.confident == (decision.confidence >= intent_router.threshold
+                                  and decision.margin >= intent_router.margin)
+
+    # The values come from the calibration messages; how well they route is checked on held-out ones below
+    decisions = intent_router.score_messages([item["message"] for item in items])
+    assert (intent_router.threshold, intent_router.margin) == calibrate_router(decisions,
+                                                                               [item["route"] for item in items])
+
+
+def test_router_keeps_a_fixed_threshold(stub_embeddings):
+    items = load_router_eval()["order_action"]
+    intent_router = IntentRouter(ORDER_ACTION_EXEMPLARS, threshold=0.5, margin=None, calibration=items)
+    intent_router.route("where is my order?")
+    assert intent_router.threshold == 0.5 and intent_router.margin is not None
+
+
+@pytest.mark.parametrize("name", ["graph", "order_action"])
+def test_calibrated_routers_on_bge_small(bge_small, name):
+    items = load_router_eval()[name]
+    # Messages are grouped by route, so every other one leaves about half of each route for the check
+    calibration, held_out = items[::2], items[1::2]
+    intent_router = IntentRouter(EXEMPLARS[name], threshold=None, margin=None, calibration=calibration)
+    intent_router.calibrate()
+
+    decisions = intent_router.score_messages([item["message"] for item in held_out])
+    accuracy, coverage = routing_quality(decisions, [item["route"] for item in held_out],
+                                         intent_router.threshold, intent_router.margin)
+    # A held-out half has only about ten confident decisions, so the target is relaxed by one miss in ten
+    assert accuracy >= ROUTER_TARGET_ACCURACY - 0.1
+    # Most messages should still be routed without the LLM
+    assert coverage >= 0.5